@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+
+BEHAVIORS = [
+    "Leave pre-existing folders alone",
+    "Sort contents of pre-existing folders",
+    "Move pre-existing folders to archive",
+]
+TREES = ["flat", "deep", "small", "mixed", "mp3"]
+CONFIG_PATH = Path(__file__).resolve().parent / "sort_config.json"
+
+# --- Synthetic trees ---
+
+def _id3_tag(title, artist):
+    # Minimal ID3v2.3 tag with TIT2/TPE1 text frames, followed by an MPEG
+    # frame header so the file looks like an MP3.
+    frames = b""
+    for frame_id, text in ((b"TIT2", title), (b"TPE1", artist)):
+        body = b"\x03" + text.encode("utf-8")
+        frames += frame_id + len(body).to_bytes(4, "big") + b"\x00\x00" + body
+    size = len(frames)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + syncsafe + frames
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def generate_tree(root, tree, files, config):
+    # Returns the number of files written. Every tree also gets a few
+    # pre-existing folders so all three behaviours have work to do.
+    extensions = list(config.keys()) + [".zzz", ".log"]
+    root = Path(root)
+    for i in range(3):
+        folder = root / f"existing_{i}"
+        folder.mkdir()
+        for j in range(5):
+            _write(folder / f"inner_{j}{extensions[j % len(extensions)]}", b"x" * 64)
+
+    for i in range(files):
+        if tree == "flat":
+            path = root / f"file_{i}{extensions[i % len(extensions)]}"
+            data = b"x" * 4096
+        elif tree == "deep":
+            # Spread over depths 0-5 so every behaviour has files to move:
+            # the top level for all of them, the d0-d3 folders' contents
+            # when those are sorted, and whole subtrees when archived.
+            parts = [f"d{(i >> shift) % 4}" for shift in (0, 2, 4, 6, 8)][:i % 6]
+            path = root.joinpath(*parts) / f"file_{i}{extensions[i % len(extensions)]}"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            data = b"x" * 4096
+        elif tree == "small":
+            path = root / f"file_{i}{extensions[i % len(extensions)]}"
+            data = b"x"
+        elif tree == "mixed":
+            ext = extensions[i % len(extensions)]
+            path = root / f"file_{i}{ext}"
+            data = b"x" * (512 << (i % 8))
+        elif tree == "mp3":
+            path = root / f"track_{i}.mp3"
+            tag = _id3_tag(f"Title {i}", f"Artist {i % 50}") if i % 2 else b""
+            data = tag + b"\xff\xfb\x90\x00" + b"\x00" * 1024
+        else:
+            raise ValueError(f"Unknown tree: {tree}")
+        _write(path, data)
+    return files + 15
+
+# --- Measurement ---
+
+def _proc_io():
+    # Read/write syscall counters from /proc; empty where unavailable.
+    try:
+        with open("/proc/self/io", "r") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return {"syscr": int(fields["syscr"]), "syscw": int(fields["syscw"])}
+    except (OSError, KeyError, ValueError):
+        return {}
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+class _SyscallCounter:
+    # Counts file-system audit events (open, scandir, rename, mkdir, ...)
+    # raised by the interpreter; a portable stand-in for strace.
+    PREFIXES = ("open", "os.", "shutil.")
+
+    def __init__(self):
+        self.counts = {}
+        self.enabled = False
+        sys.addaudithook(self._hook)
+
+    def _hook(self, event, args):
+        if self.enabled and event.startswith(self.PREFIXES):
+            self.counts[event] = self.counts.get(event, 0) + 1
+
+    def measure(self, func):
+        self.counts = {}
+        before = _proc_io()
+        self.enabled = True
+        started = time.perf_counter()
+        try:
+            result = func()
+        finally:
+            elapsed = time.perf_counter() - started
+            self.enabled = False
+        after = _proc_io()
+        io_counts = {key: after[key] - before[key] for key in after}
+        return result, elapsed, {"audit": dict(sorted(self.counts.items())), **io_counts}
+
+def run_case(tree, behavior, files, workers):
+    # Runs in a fresh interpreter so peak RSS belongs to this case alone.
+    os.environ["SORTLY_HOME"] = tempfile.mkdtemp(prefix="sortly-bench-home-")
+    import sorter
+    import undo_sort
+
+    with open(CONFIG_PATH, "r") as f:
+        config = json.load(f)
+    config[".mp3"] = {"folder": "Audio", "subfolder": "musictype"}
+
+    root = tempfile.mkdtemp(prefix="sortly-bench-")
+    try:
+        total = generate_tree(root, tree, files, config)
+        counter = _SyscallCounter()
+        devnull = open(os.devnull, "w")
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            summary, sort_s, sort_calls = counter.measure(
+                lambda: sorter.scan_and_sort(root, config, behavior, workers=workers))
+            _, undo_s, undo_calls = counter.measure(
+                lambda: undo_sort.undo_run(summary["run_id"], workers=workers))
+        finally:
+            sys.stdout = stdout
+            devnull.close()
+        moved = summary["throughput"]["files"]
+        move_paths = summary.get("move_paths", {})
+        return {
+            "tree": tree,
+            "behavior": behavior,
+            "workers": workers,
+            "files": total,
+            "moved": moved,
+            # Archived folders are moved by one rename each, whatever they hold
+            "folders_moved": sum(move_paths.values()) - moved - summary.get("duplicates_linked", 0),
+            "sort_seconds": round(sort_s, 4),
+            "sort_files_per_s": round(moved / sort_s, 1) if sort_s else None,
+            "undo_seconds": round(undo_s, 4),
+            "undo_files_per_s": round(moved / undo_s, 1) if undo_s else None,
+            "peak_rss_kb": _peak_rss_kb(),
+            "sort_syscalls": sort_calls,
+            "undo_syscalls": undo_calls,
+            "move_paths": move_paths,
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(os.environ["SORTLY_HOME"], ignore_errors=True)
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=CONFIG_PATH.parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Sortly on synthetic trees")
+    parser.add_argument("--files", type=int, default=5000, help="Files per synthetic tree")
+    parser.add_argument("--trees", nargs="+", default=TREES, choices=TREES)
+    parser.add_argument("--workers", type=int, default=1, help="Move lanes for sort and undo")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file the run is appended to")
+    parser.add_argument("--case", nargs=2, metavar=("TREE", "BEHAVIOR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case[0], args.case[1], args.files, args.workers)))
+        return
+
+    results = []
+    for tree in args.trees:
+        for behavior in BEHAVIORS:
+            proc = subprocess.run(
+                [sys.executable, __file__, "--case", tree, behavior,
+                 "--files", str(args.files), "--workers", str(args.workers)],
+                capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"{tree:<6} {behavior}: failed\n{proc.stderr}")
+                continue
+            result = json.loads(proc.stdout.splitlines()[-1])
+            results.append(result)
+            print(f"{tree:<6} {behavior:<40} sort {result['sort_files_per_s']:>10} files/s  "
+                  f"undo {result['undo_files_per_s']:>10} files/s  folders {result['folders_moved']:>3}  "
+                  f"rss {result['peak_rss_kb']} KB")
+
+    run = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "files": args.files,
+        "workers": args.workers,
+        "results": results,
+    }
+    history = []
+    if os.path.exists(args.output):
+        with open(args.output, "r") as f:
+            history = json.load(f)
+    history.append(run)
+    with open(args.output, "w") as f:
+        json.dump(history, f, indent=2)
+    print(f"\nResults appended to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+import json
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+class PersistentLRU:
+    """Small LRU cache of JSON-serialisable values, persisted to one file.
+
+    Keys are built from a file's path, size and mtime, so an edited or
+    replaced file simply misses and is read again. The file is loaded
+    lazily on first use and written back atomically by save().
+    """
+
+    def __init__(self, path, maxsize=100000):
+        self.path = Path(path)
+        self.maxsize = maxsize
+        self.entries = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(path, st):
+        return f"{path}\0{st.st_size}\0{st.st_mtime_ns}"
+
+    def _load(self):
+        self.entries = OrderedDict()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def get(self, key, default=None):
+        with self.lock:
+            if self.entries is None:
+                self._load()
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            if self.entries is None:
+                self._load()
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
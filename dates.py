@@ -0,0 +1,134 @@
+import os
+import re
+import struct
+from datetime import date, datetime
+from cache import PersistentLRU
+from journal import LOG_DIR
+
+# Embedded dates are looked for in this much of the start of a file; EXIF
+# sits in the first segments of a JPEG, and PDFs get one more read of the
+# same size from the end, where the document info of saved-over files is.
+HEADER_BYTES = 65536
+
+EXIF_IFD_POINTER = 0x8769
+EXIF_DATE_ORIGINAL = 0x9003
+EXIF_DATE_DIGITIZED = 0x9004
+TIFF_DATETIME = 0x0132
+EXIF_ASCII = 2
+
+_EXIF_DATE = re.compile(rb"(\d{4})[:-](\d{2})[:-](\d{2})")
+_PDF_DATE = re.compile(rb"/CreationDate\s*\(\s*(?:D:)?(\d{4})(\d{2})?(\d{2})?")
+
+# Keyed like the sniff cache, by inode rather than path, so the dates of
+# files that have already been sorted once are still known after the move.
+date_cache = PersistentLRU(LOG_DIR / "date_cache.json")
+
+def creation_time(st):
+    # Birth time where the platform reports it: st_birthtime on macOS/BSD
+    # (and Windows from Python 3.12), st_ctime on older Windows. On Linux
+    # st_ctime is the inode change time, reset by every copy or chmod, so
+    # the modification time is the better stand-in there.
+    birth = getattr(st, "st_birthtime", None)
+    if birth:
+        return birth
+    if os.name == "nt":
+        return st.st_ctime
+    return st.st_mtime
+
+def _valid_date(year, month=b"01", day=b"01"):
+    try:
+        return date(int(year), int(month or b"01"), int(day or b"01"))
+    except ValueError:
+        # "0000:00:00 00:00:00" is what cameras write when the clock is unset
+        return None
+
+def _jpeg_exif(header):
+    # The TIFF structure inside the APP1 "Exif" segment, or None. Only the
+    # segments before the image data are walked.
+    pos = 2
+    while pos + 4 <= len(header):
+        if header[pos] != 0xFF:
+            return None
+        marker = header[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD9, 0xDA):
+            return None
+        length = int.from_bytes(header[pos + 2:pos + 4], "big")
+        if marker == 0xE1 and header[pos + 4:pos + 10] == b"Exif\x00\x00":
+            return header[pos + 10:pos + 2 + length]
+        pos += 2 + length
+    return None
+
+def _exif_date(tiff):
+    # DateTimeOriginal, then DateTimeDigitized, then the IFD0 DateTime.
+    if tiff[:4] == b"II*\x00":
+        endian = "<"
+    elif tiff[:4] == b"MM\x00*":
+        endian = ">"
+    else:
+        return None
+
+    def read_ifd(offset):
+        entries = {}
+        if offset + 2 > len(tiff):
+            return entries
+        count = struct.unpack_from(endian + "H", tiff, offset)[0]
+        for pos in range(offset + 2, min(offset + 2 + count * 12, len(tiff) - 11), 12):
+            tag, type_, n, value = struct.unpack_from(endian + "HHII", tiff, pos)
+            entries[tag] = (type_, n, value)
+        return entries
+
+    ifd0 = read_ifd(struct.unpack_from(endian + "I", tiff, 4)[0])
+    candidates = []
+    if EXIF_IFD_POINTER in ifd0:
+        exif = read_ifd(ifd0[EXIF_IFD_POINTER][2])
+        candidates += [exif.get(EXIF_DATE_ORIGINAL), exif.get(EXIF_DATE_DIGITIZED)]
+    candidates.append(ifd0.get(TIFF_DATETIME))
+    for entry in candidates:
+        if entry is None or entry[0] != EXIF_ASCII or entry[1] < 10:
+            continue
+        # Dates are 20 bytes, so the value field holds an offset to them
+        match = _EXIF_DATE.match(tiff, entry[2], entry[2] + entry[1])
+        found = match and _valid_date(*match.groups())
+        if found:
+            return found
+    return None
+
+def read_metadata_date(path, size=None):
+    # The date a photo was taken (EXIF) or a PDF was created, read from the
+    # file's header region; None when the file carries neither.
+    with open(path, "rb") as f:
+        header = f.read(HEADER_BYTES)
+        if header.startswith(b"\xff\xd8\xff"):
+            tiff = _jpeg_exif(header)
+            return _exif_date(tiff) if tiff else None
+        if header[:4] in (b"II*\x00", b"MM\x00*"):
+            # TIFF and the raw formats built on it (DNG, NEF, CR2, ARW, ...)
+            return _exif_date(header)
+        if header.startswith(b"%PDF-"):
+            match = _PDF_DATE.search(header)
+            if match is None and (size or 0) > HEADER_BYTES:
+                f.seek(-HEADER_BYTES, os.SEEK_END)
+                match = _PDF_DATE.search(f.read(HEADER_BYTES))
+            return _valid_date(*match.groups()) if match else None
+    return None
+
+def file_date(path, st, metadata=False, inode=None):
+    # The date a file is filed under. With `metadata`, an EXIF or PDF date
+    # wins over the file system's; parsed dates are cached by (inode, size,
+    # mtime) so a re-sort never opens the same unchanged file twice.
+    if metadata:
+        key = f"{inode or st.st_ino}\0{st.st_size}\0{st.st_mtime_ns}"
+        cached = date_cache.get(key)
+        if cached is None:
+            try:
+                found = read_metadata_date(path, st.st_size)
+            except (OSError, struct.error):
+                found = None
+            cached = found.isoformat() if found else ""
+            date_cache.put(key, cached)
+        if cached:
+            return date.fromisoformat(cached)
+    return datetime.fromtimestamp(creation_time(st)).date()
@@ -0,0 +1,87 @@
+import os
+import mmap
+import shutil
+import hashlib
+
+DUPLICATES_FOLDER = "Duplicates"
+# Bytes hashed from each end of a file in the partial-hash stage
+PARTIAL_BLOCK = 64 * 1024
+
+def _partial_hash(path, size):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        digest.update(f.read(PARTIAL_BLOCK))
+        if size > PARTIAL_BLOCK:
+            f.seek(max(PARTIAL_BLOCK, size - PARTIAL_BLOCK))
+            digest.update(f.read(PARTIAL_BLOCK))
+    return digest.hexdigest()
+
+def _full_hash(path, size):
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            digest.update(mapped)
+    return digest.hexdigest()
+
+def _refine(groups, hash_func, pool, cancel=None):
+    # Splits every group by hash_func, hashing all files of all groups on
+    # the pool at once; files that cannot be read drop out, and so does
+    # every file not hashed yet once `cancel` is set.
+    jobs = [(path, size) for paths, size in groups for path in paths]
+
+    def safe_hash(job):
+        if cancel is not None and cancel.is_set():
+            return None
+        try:
+            return hash_func(*job)
+        except (OSError, ValueError):
+            return None
+
+    hashes = dict(zip((path for path, _ in jobs), pool.map(safe_hash, jobs)))
+    refined = []
+    for paths, size in groups:
+        buckets = {}
+        for path in paths:
+            if hashes[path] is not None:
+                buckets.setdefault(hashes[path], []).append(path)
+        refined.extend((bucket, size) for bucket in buckets.values() if len(bucket) > 1)
+    return refined
+
+def find_duplicates(files, pool, cancel=None):
+    # files: iterable of (path, size). Returns lists of identical files,
+    # each sorted so the first path is the copy to keep; none once `cancel`
+    # (a threading.Event) is set.
+    #
+    # Files are grouped by size first; only sizes shared by several files
+    # have their first and last blocks hashed, and only groups that still
+    # collide after that are hashed in full. Empty files are ignored.
+    by_size = {}
+    for path, size in files:
+        if size > 0:
+            by_size.setdefault(size, []).append(path)
+    groups = [(paths, size) for size, paths in by_size.items() if len(paths) > 1]
+
+    groups = _refine(groups, _partial_hash, pool, cancel)
+    # Files no larger than the two partial blocks were hashed whole already
+    small = [(paths, size) for paths, size in groups if size <= 2 * PARTIAL_BLOCK]
+    large = [(paths, size) for paths, size in groups if size > 2 * PARTIAL_BLOCK]
+    groups = small + _refine(large, _full_hash, pool, cancel)
+    if cancel is not None and cancel.is_set():
+        return []
+    return [sorted(paths) for paths, _ in groups]
+
+def link_duplicate(duplicate, keeper):
+    # Replaces `duplicate` with a hard link to `keeper`, in place.
+    tmp_path = duplicate + ".sortly-link"
+    os.link(keeper, tmp_path)
+    try:
+        os.replace(tmp_path, duplicate)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+
+def unlink_duplicate(path):
+    # Undo of link_duplicate: gives `path` its own copy of the data again.
+    tmp_path = path + ".sortly-unlink"
+    shutil.copy2(path, tmp_path)
+    os.replace(tmp_path, path)
@@ -0,0 +1,75 @@
+import os
+import json
+from pathlib import Path
+
+# Logs live in one per-user place so undo works from any working directory.
+LOG_DIR = Path(os.environ.get("SORTLY_HOME", Path.home() / ".sortly")) / "logs"
+# Written by older versions into the working directory; still undoable.
+LEGACY_HISTORY_PATH = Path("logs") / "move_history.json"
+
+class MoveJournal:
+    """Append-only, line-delimited record of the moves made by a sort.
+
+    Records are buffered and written in batches; every batch is flushed and
+    fsync'ed, so after a crash the journal holds every move up to the last
+    sync point and can still be undone.
+    """
+
+    def __init__(self, path, batch_size=500, header=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.buffer = []
+        self.count = 0
+        self.file = open(self.path, "w", encoding="utf-8")
+        if header is not None:
+            self.buffer.append(json.dumps(header) + "\n")
+            self.sync()
+
+    def append(self, src, dst, type_):
+        self.buffer.append(json.dumps({"source": str(src), "destination": str(dst), "type": type_}) + "\n")
+        self.count += 1
+        if len(self.buffer) >= self.batch_size:
+            self.sync()
+
+    def sync(self):
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.buffer = []
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+def iter_journal_reverse(path, chunk_size=65536):
+    # Yields journal records newest first, reading the file backwards in
+    # fixed-size chunks so memory does not grow with the journal. A torn
+    # last line from an interrupted write is skipped.
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            step = min(chunk_size, position)
+            position -= step
+            f.seek(position)
+            lines = (f.read(step) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                record = _parse(line)
+                if record is not None:
+                    yield record
+        record = _parse(remainder)
+        if record is not None:
+            yield record
+
+def _parse(line):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
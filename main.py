@@ -1,9 +1,284 @@
+import os
+import sys
+import time
+import signal
 import argparse
-from sorter import scan_and_sort
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sorter import scan_and_sort, plan_sort, save_plan, load_plan, execute_plan
+from metrics import Metrics, format_table
+
+# Profiles saved from the GUI live here, one <name>.json per template.
+CONFIG_DIR = "configs"
+BEHAVIORS = {
+    "leave": "Leave pre-existing folders alone",
+    "contents": "Sort contents of pre-existing folders",
+    "archive": "Move pre-existing folders to archive",
+}
+
+def print_event(kind, payload):
+    if kind == "moved":
+        note = " (replaced the existing file; undo cannot restore it)" if payload.collision == "overwrite" else ""
+        print(f"Moved {payload.source} -> {payload.destination}{note}")
+    elif kind == "linked":
+        print(f"Linked duplicate {payload.source} -> {payload.destination}")
+    elif kind == "error":
+        move, error = payload
+        action = "scanning" if move.type == "scan" else "moving"
+        print(f"Error {action} {move.source}: {error}")
+    elif kind == "complete":
+        print("\nSorting complete.")
+    elif kind == "cancelled":
+        print("\nSorting stopped; moves made so far can be undone.")
+
+class JsonLog:
+    """Structured log: one JSON object per engine event, for --log-json.
+
+    Move events carry the file and rule, "progress" the counters so far,
+    and the final "complete"/"cancelled" record the whole summary,
+    including stage timings when they were collected.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def handler(self, folder):
+        def on_event(kind, payload):
+            record = {"time": round(time.time(), 3), "folder": folder, "event": kind}
+            if kind in ("moved", "linked"):
+                record.update(payload._asdict())
+            elif kind == "error":
+                move, error = payload
+                record.update(source=move.source, destination=move.destination, type=move.type, error=error)
+            else:
+                record.update(payload)
+            line = json.dumps(record) + "\n"
+            with self.lock:
+                self.file.write(line)
+        return on_event
+
+    def close(self):
+        self.file.close()
+
+def combine_handlers(*handlers):
+    handlers = [handler for handler in handlers if handler is not None]
+    if len(handlers) < 2:
+        return handlers[0] if handlers else None
+
+    def on_event(kind, payload):
+        for handler in handlers:
+            handler(kind, payload)
+    return on_event
+
+def write_profile(profiles, path):
+    import pstats
+    stats = pstats.Stats(*profiles)
+    stats.dump_stats(path)
+    print(f"Profile written to {path} (inspect with: python -m pstats {path})", file=sys.stderr)
+
+def cancel_on_interrupt():
+    # The first Ctrl+C stops the sort after the moves in flight; a second
+    # one interrupts as usual.
+    cancel = threading.Event()
+
+    def handler(signum, frame):
+        cancel.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, handler)
+    return cancel
+
+def behavior_name(value):
+    # Accepts a short alias ("leave", "contents", "archive") or a full name.
+    if value in BEHAVIORS:
+        return BEHAVIORS[value]
+    if value in BEHAVIORS.values():
+        return value
+    raise argparse.ArgumentTypeError(f"unknown behavior {value!r}; use one of: {', '.join(BEHAVIORS)}")
+
+def load_config(name):
+    # `name` is a rules file, or the name of a profile in CONFIG_DIR.
+    path = name if os.path.isfile(name) else os.path.join(CONFIG_DIR, f"{name}.json")
+    if not os.path.isfile(path):
+        profiles = sorted(f[:-5] for f in os.listdir(CONFIG_DIR) if f.endswith(".json")) \
+            if os.path.isdir(CONFIG_DIR) else []
+        raise SystemExit(f"No rules file or profile named {name!r}. Profiles: {', '.join(profiles) or 'none'}")
+    with open(path, "r") as f:
+        return json.load(f)
+
+def read_manifest(path):
+    # One folder per line; blank lines and lines starting with # are skipped.
+    f = sys.stdin if path == "-" else open(path, "r")
+    try:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def summary_path(summary_dir, folder):
+    digest = hashlib.sha1(folder.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(summary_dir, f"{os.path.basename(folder) or 'root'}-{digest}.json")
+
+def run_sort(folder, config, args, on_event=None, cancel=None, io_limit=None, profiles=None):
+    # One scan_and_sort with the options given on the command line. With
+    # --profile the sort runs under cProfile, on this thread, and the
+    # profile is added to `profiles` once profiling has started.
+    kwargs = dict(workers=args.workers, incremental=args.incremental, sniff_mode=args.sniff,
+                  dedupe_mode=args.dedupe, collision_policy=args.on_collision, on_event=on_event,
+                  cancel=cancel, io_limit=io_limit, metrics=Metrics() if args.timings else None,
+                  count_archived=not args.no_archive_counts, plan_ahead=profiles is None)
+    if profiles is None:
+        return scan_and_sort(folder, config, args.behavior, **kwargs)
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    profiles.append(profile)
+    try:
+        return scan_and_sort(folder, config, args.behavior, **kwargs)
+    finally:
+        profile.disable()
+
+def sort_folder(folder, config, args, cancel, io_limit, on_event=None, json_log=None, profiles=None):
+    # Sorts one folder of a batch; never raises, so one bad folder does not
+    # stop the others. Returns the folder's JSON summary.
+    folder = os.path.abspath(folder)
+    if not os.path.isdir(folder):
+        return {"folder": folder, "status": "failed", "error": "not a directory"}
+    if json_log is not None:
+        on_event = combine_handlers(on_event, json_log.handler(folder))
+    try:
+        summary = run_sort(folder, config, args, on_event, cancel, io_limit, profiles)
+    except Exception as e:
+        return {"folder": folder, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+    result = {"folder": folder}
+    for key in ("status", "run_id", "throughput", "move_paths", "errors", "duplicates_linked", "overwritten",
+                "metrics"):
+        if key in summary:
+            result[key] = summary.pop(key)
+    result["folders"] = summary
+    return result
+
+def sort_folders(folders, config, args, json_log=None, profiles=None):
+    # Sorts every folder, args.jobs at a time, printing one JSON line per
+    # folder as it finishes. Returns True if all of them were sorted.
+    cancel = cancel_on_interrupt()
+    io_limit = threading.BoundedSemaphore(args.io_limit) if args.io_limit else None
+    on_event = print_event if args.verbose else None
+    if args.summary_dir:
+        os.makedirs(args.summary_dir, exist_ok=True)
+
+    ok = True
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = [pool.submit(sort_folder, folder, config, args, cancel, io_limit, on_event, json_log, profiles)
+                   for folder in folders]
+        for future in as_completed(futures):
+            result = future.result()
+            ok = ok and result["status"] == "complete"
+            print(json.dumps(result), flush=True)
+            if args.summary_dir:
+                with open(summary_path(args.summary_dir, result["folder"]), "w") as f:
+                    json.dump(result, f, indent=2)
+    return ok
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Smart File Sorter")
-    parser.add_argument("folder", help="Folder to sort")
+    parser.add_argument("folders", nargs="*", metavar="folder", help="Folder(s) to sort")
+    parser.add_argument("--manifest", metavar="FILE", help="File listing folders to sort, one per line ('-' for stdin)")
+    parser.add_argument("--config", default="sort_config.json",
+                        help=f"Rules file, or the name of a profile saved in {CONFIG_DIR}/")
+    parser.add_argument("--behavior", default=BEHAVIORS["leave"], type=behavior_name,
+                        help=f"What to do with pre-existing folders: {', '.join(BEHAVIORS)} (or the full name)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the move plan without moving anything")
+    parser.add_argument("--save-plan", metavar="FILE", help="With --dry-run, also save the plan to FILE")
+    parser.add_argument("--run-plan", metavar="FILE", help="Execute a plan saved with --save-plan")
+    parser.add_argument("--workers", type=int, default=1, help="Number of parallel move lanes per folder")
+    parser.add_argument("--jobs", type=int, default=4, help="Folders sorted at the same time")
+    parser.add_argument("--io-limit", type=int, metavar="N",
+                        help="At most N directories being moved into at once, across all folders")
+    parser.add_argument("--summary-dir", metavar="DIR", help="Write a JSON summary per folder into DIR")
+    parser.add_argument("--json", action="store_true",
+                        help="Print a JSON summary per folder instead of every move (implied by several folders)")
+    parser.add_argument("--verbose", action="store_true", help="With several folders, still print every move")
+    parser.add_argument("--timings", action="store_true",
+                        help="Time every stage (walk, match, stat, year, mkdir, rename, ...) and report it")
+    parser.add_argument("--log-json", metavar="FILE", help="Append a JSON line per event to FILE")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Run sorts under cProfile, one folder at a time, and write pstats data to FILE "
+                             "(move lanes are not covered)")
+    parser.add_argument("--no-archive-counts", action="store_true",
+                        help="Do not count the entries of folders moved to the archive for the summary")
+    parser.add_argument("--incremental", action="store_true", help="Skip entries already classified by an earlier run")
+    parser.add_argument("--sniff", choices=["missing", "all"],
+                        help="Classify files by content: only those no rule matches, or all of them")
+    parser.add_argument("--dedupe", choices=["folder", "hardlink"],
+                        help="Move duplicate files to Duplicates/, or replace them with hard links to one copy")
+    parser.add_argument("--on-collision", default="rename", choices=["rename", "skip", "overwrite"],
+                        help="When a file of the same name is already there: add a (n) suffix, leave the file, "
+                             "or replace it (replaced files cannot be restored by undo)")
+    parser.add_argument("--watch", action="store_true", help="Keep running and sort new files as they arrive")
+    parser.add_argument("--poll", type=float, metavar="SECONDS",
+                        help="With --watch, rescan every SECONDS instead of using inotify")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="With --watch, seconds a file must stay unchanged before it is sorted")
     args = parser.parse_args()
-    
-    scan_and_sort(args.folder)
+
+    folders = list(args.folders)
+    if args.manifest:
+        folders += read_manifest(args.manifest)
+    folders = list(dict.fromkeys(folders))
+
+    if args.run_plan:
+        execute_plan(load_plan(args.run_plan), workers=args.workers, on_event=print_event,
+                     cancel=cancel_on_interrupt(), count_archived=not args.no_archive_counts)
+    elif not folders:
+        parser.error("a folder is required unless --run-plan is given")
+    elif len(folders) > 1 and (args.watch or args.save_plan):
+        parser.error("--watch and --save-plan take a single folder")
+    else:
+        config = load_config(args.config)
+
+        if args.dry_run:
+            for folder in folders:
+                plan = plan_sort(folder, config, args.behavior, workers=args.workers, sniff_mode=args.sniff,
+                                 dedupe_mode=args.dedupe, collision_policy=args.on_collision)
+                for move in plan["moves"]:
+                    note = f" [{move.collision}]" if move.collision else ""
+                    print(f"{move.source} -> {move.destination} ({move.rule or move.type}){note}")
+                print(f"\n{len(plan['moves'])} planned move(s) in {plan['folder']}.")
+                if args.save_plan:
+                    save_plan(plan, args.save_plan)
+        elif args.watch:
+            from watch import watch
+            try:
+                watch(folders[0], config, args.behavior, workers=args.workers, poll=args.poll is not None,
+                      poll_interval=args.poll or 5.0, settle=args.settle, incremental=args.incremental,
+                      sniff_mode=args.sniff, dedupe_mode=args.dedupe, collision_policy=args.on_collision,
+                      on_event=print_event)
+            except KeyboardInterrupt:
+                print("\nStopped watching.")
+        else:
+            json_log = JsonLog(args.log_json) if args.log_json else None
+            profiles = [] if args.profile else None
+            if args.profile and args.jobs > 1 and len(folders) > 1:
+                # Only one profiler can be active at a time (Python 3.12+)
+                print("--profile sorts one folder at a time; ignoring --jobs.", file=sys.stderr)
+                args.jobs = 1
+            try:
+                if len(folders) > 1 or args.json or args.summary_dir:
+                    ok = sort_folders(folders, config, args, json_log, profiles)
+                else:
+                    folder = os.path.abspath(folders[0])
+                    on_event = combine_handlers(print_event, json_log and json_log.handler(folder))
+                    summary = run_sort(folder, config, args, on_event, cancel_on_interrupt(), profiles=profiles)
+                    if args.timings:
+                        print("\n" + format_table(summary["metrics"]))
+                    ok = summary["status"] == "complete"
+            finally:
+                if json_log is not None:
+                    json_log.close()
+                if profiles:
+                    write_profile(profiles, args.profile)
+            sys.exit(0 if ok else 1)
@@ -0,0 +1,92 @@
+import time
+import threading
+
+# Histogram buckets are powers of two in microseconds: bucket n counts
+# calls that took less than 2**n µs (bucket 0: under 1 µs).
+
+class Metrics:
+    """Per-stage call counts, total time and latency histograms for a sort.
+
+    The engine only records into a Metrics when one is passed in; with
+    metrics=None every hot path skips the clock reads entirely. Recording
+    is thread-safe, since move lanes record from their own threads.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds, count=1):
+        # `count` items handled in `seconds`; the histogram gets the
+        # per-item latency.
+        bucket = int(seconds * 1e6 / count).bit_length()
+        with self.lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = self.stages[stage] = {"count": 0, "seconds": 0.0, "max": 0.0, "buckets": {}}
+            entry["count"] += count
+            entry["seconds"] += seconds
+            entry["max"] = max(entry["max"], seconds / count)
+            entry["buckets"][bucket] = entry["buckets"].get(bucket, 0) + count
+
+    def timed(self, stage):
+        return _Timed(self, stage)
+
+    def timed_iter(self, iterable, stage):
+        # Yields from `iterable`, recording how long each item took to produce.
+        it = iter(iterable)
+        clock = time.perf_counter
+        while True:
+            started = clock()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            self.add(stage, clock() - started)
+            yield item
+
+    def as_dict(self):
+        result = {}
+        with self.lock:
+            for stage, entry in sorted(self.stages.items(), key=lambda item: -item[1]["seconds"]):
+                result[stage] = {
+                    "count": entry["count"],
+                    "seconds": round(entry["seconds"], 6),
+                    "mean_us": round(entry["seconds"] * 1e6 / entry["count"], 2),
+                    "max_us": round(entry["max"] * 1e6, 2),
+                    "histogram_us": {f"<{1 << bucket}": n for bucket, n in sorted(entry["buckets"].items())},
+                }
+        return result
+
+class _Timed:
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add(self.stage, time.perf_counter() - self.started)
+        return False
+
+def format_table(stages):
+    # Plain-text table of Metrics.as_dict() for the CLI.
+    lines = [f"{'stage':<10} {'count':>9} {'seconds':>9} {'mean µs':>9} {'max µs':>10}  p50/p99 (µs, bucket)"]
+    for stage, entry in stages.items():
+        lines.append(f"{stage:<10} {entry['count']:>9} {entry['seconds']:>9.3f} {entry['mean_us']:>9.1f} "
+                     f"{entry['max_us']:>10.1f}  {_percentile(entry, 0.5)}/{_percentile(entry, 0.99)}")
+    return "\n".join(lines)
+
+def _percentile(entry, fraction):
+    # Upper bound of the histogram bucket holding the given percentile.
+    target = entry["count"] * fraction
+    seen = 0
+    for label, n in entry["histogram_us"].items():
+        seen += n
+        if seen >= target:
+            return label
+    return "?"
@@ -1,17 +1,23 @@
 import sys
+import time
+_STARTED = time.perf_counter()
+if "--startup-timing" in sys.argv:
+    # Installed before anything else is imported so every import is timed
+    import startup_timing
+    startup_timing.install(_STARTED)
 import os
 import json
 import threading
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel,
-    QLineEdit, QFileDialog, QComboBox, QTextEdit, QMessageBox, QTableWidget,
-    QTableWidgetItem, QHeaderView, QAbstractItemView, QSizePolicy, QMenu
+    QLineEdit, QFileDialog, QComboBox, QPlainTextEdit, QMessageBox, QTableView,
+    QHeaderView, QAbstractItemView, QSizePolicy, QMenu, QProgressBar, QStyledItemDelegate
 )
-from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtCore import Qt, QPoint, QObject, pyqtSignal, QAbstractTableModel, QModelIndex
 from PyQt5.QtGui import QPalette, QColor, QFontDatabase, QFont, QIcon
-from sorter import scan_and_sort
-from undo_sort import undo_moves
 from PyQt5.QtCore import QTimer
+# sorter and undo_sort are imported when first used, keeping them (and
+# everything they import) off the startup path.
 
 CONFIG_DIR = "configs"
 DEFAULT_CONFIG_NAME = "default"
@@ -31,11 +37,251 @@ DEFAULT_RULES = {
     ".lnk": {"folder": "Shortcuts", "subfolder": None}
 }
 
+# Lines kept in the log view; older ones are dropped as new ones arrive.
+LOG_MAX_LINES = 10000
+# Milliseconds log lines are gathered before they are appended in one go.
+LOG_FLUSH_MS = 100
+SUBFOLDER_CHOICES = ["None", "Year", "Month", "Day", "MusicType"]
+
+STYLESHEET = """
+QWidget {
+    background-color: #1e1e1e;
+    color: #ffffff;
+}
+QHeaderView::section {
+    background-color: #333;
+    color: white;
+    padding: 4px;
+    border: 1px solid #444;
+}
+QTableView {
+    background-color: #2a2a2a;
+    color: white;
+    gridline-color: #444;
+    selection-background-color: #3b82f6;
+    selection-color: black;
+}
+QTableView QTableCornerButton::section {
+    background-color: #333;
+    border: 1px solid #444;
+}
+QComboBox {
+    background-color: #2a2a2a;
+    color: white;
+}
+QComboBox QAbstractItemView {
+    background-color: #2a2a2a;
+    color: white;
+    selection-background-color: #3b82f6;
+    selection-color: black;
+}
+QPushButton {
+    background-color: #3b82f6;
+    color: white;
+    padding: 6px 12px;
+    border-radius: 5px;
+}
+QPushButton:hover {
+    background-color: #2563eb;
+}
+QLineEdit, QPlainTextEdit {
+    background-color: #2a2a2a;
+    color: white;
+    border: 1px solid #444;
+    border-radius: 4px;
+    padding: 4px;
+}
+QLabel {
+    font-weight: bold;
+    color: white;
+}
+"""
+
+MENU_STYLESHEET = """
+QMenu {
+    background-color: #2a2a2a;
+    color: white;
+    border: 1px solid #444;
+}
+QMenu::item {
+    background-color: transparent;
+    padding: 6px 20px;
+}
+QMenu::item:selected {
+    background-color: #FFFFFF;
+    color: black;
+}
+"""
+
 def resource_path(relative_path):
     base_path = getattr(sys, '_MEIPASS', os.path.abspath("."))
     return os.path.join(base_path, relative_path)
 
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+class SortWorker(QObject):
+    """Runs a sort off the UI thread and reports back through signals.
+
+    Engine events arrive for every move; they are collected here and
+    handed to the UI at most every UPDATE_INTERVAL seconds, so even a very
+    large sort costs the UI thread only a few updates per second.
+    """
+
+    UPDATE_INTERVAL = 0.1
+
+    progress = pyqtSignal(dict)
+    lines = pyqtSignal(list)
+    finished = pyqtSignal(dict)
+
+    def __init__(self, folder, config, behavior):
+        super().__init__()
+        self.folder = folder
+        self.config = config
+        self.behavior = behavior
+        self.cancel = threading.Event()
+        self.pending_lines = []
+        self.latest_progress = None
+        self.last_update = 0.0
+
+    def run(self):
+        from sorter import scan_and_sort
+        try:
+            summary = scan_and_sort(self.folder, self.config, self.behavior,
+                                    on_event=self.on_event, cancel=self.cancel)
+        except Exception as e:
+            summary = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+        self.flush()
+        self.finished.emit(summary)
+
+    def on_event(self, kind, payload):
+        if kind == "moved":
+            self.pending_lines.append(f"Moved {payload.source} -> {payload.destination}")
+        elif kind == "linked":
+            self.pending_lines.append(f"Linked duplicate {payload.source} -> {payload.destination}")
+        elif kind == "error":
+            move, error = payload
+            action = "scanning" if move.type == "scan" else "moving"
+            self.pending_lines.append(f"Error {action} {move.source}: {error}")
+        elif kind == "progress":
+            self.latest_progress = payload
+        now = time.monotonic()
+        if now - self.last_update >= self.UPDATE_INTERVAL:
+            self.last_update = now
+            self.flush()
+
+    def flush(self):
+        if self.pending_lines:
+            self.lines.emit(self.pending_lines)
+            self.pending_lines = []
+        if self.latest_progress is not None:
+            self.progress.emit(self.latest_progress)
+            self.latest_progress = None
+
+class RulesModel(QAbstractTableModel):
+    """The sort config as a table model: one row per rule.
+
+    Rows hold the rule dicts themselves, so fields the table has no column
+    for (size and age conditions) survive editing and saving. The view
+    only asks for the rows on screen, so large configs stay cheap.
+    """
+
+    HEADERS = ["File Extension", "Folder Name", "Subfolder Rule"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rules = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rules)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemIsEditable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        ext, rule = self.rules[index.row()]
+        if index.column() == 0:
+            return ext
+        if index.column() == 1:
+            return rule.get("folder", "")
+        subfolder = rule.get("subfolder")
+        return {"musictype": "MusicType"}.get(subfolder, subfolder.capitalize()) if subfolder else "None"
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        ext, rule = self.rules[index.row()]
+        if index.column() == 0:
+            key = value.strip()
+            # Suffixes are stored lowercase; globs and "re:" patterns are kept
+            # as typed, since regexes are case-sensitive
+            if key.startswith(".") and not any(c in key for c in "*?["):
+                key = key.lower()
+            self.rules[index.row()] = (key, rule)
+        elif index.column() == 1:
+            rule["folder"] = value.strip()
+        else:
+            rule["subfolder"] = value.lower() if value != "None" else None
+        self.dataChanged.emit(index, index)
+        return True
+
+    def set_config(self, config):
+        self.beginResetModel()
+        self.rules = [(ext, dict(rule)) for ext, rule in config.items()]
+        self.endResetModel()
+
+    def to_config(self):
+        return {ext: dict(rule) for ext, rule in self.rules if ext}
+
+    def rule_at(self, row):
+        return self.rules[row]
+
+    def append_rule(self, ext, rule):
+        row = len(self.rules)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.rules.append((ext, dict(rule)))
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        for row in sorted(rows, reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.rules[row]
+            self.endRemoveRows()
+
+class SubfolderDelegate(QStyledItemDelegate):
+    # A combo box editor for the subfolder column, created only while a
+    # cell is being edited instead of one widget per row.
+
+    def createEditor(self, parent, option, index):
+        combo = QComboBox(parent)
+        ext = index.sibling(index.row(), 0).data()
+        current = index.data()
+        combo.addItems([c for c in SUBFOLDER_CHOICES if c != "MusicType" or ext == ".mp3" or current == c])
+        combo.activated.connect(lambda: self.commitData.emit(combo))
+        return combo
+
+    def setEditorData(self, editor, index):
+        editor.setCurrentText(index.data())
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText())
+
 class FileSorterGUI(QWidget):
+    # Lets worker threads log; Qt delivers it on the UI thread.
+    log_message = pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Sortly")
@@ -43,69 +289,13 @@ class FileSorterGUI(QWidget):
         self.resize(1300, 1100)
         self.setMinimumSize(900, 500)
 
-        font_id = QFontDatabase.addApplicationFont(resource_path("Oswald-Regular.ttf"))
-        families = QFontDatabase.applicationFontFamilies(font_id)
-        if families:
-            self.setFont(QFont(families[0], 10))
-        else:
-            print("⚠️ Oswald font not found. Falling back to default.")
-            self.setFont(QFont("Arial", 10))
+        # Work not needed for the first paint (font, config templates)
+        # runs right after it; see paintEvent.
+        self.after_first_paint = [self.load_font, self.load_available_configs]
+        self.config_names = None
+        self.icons = {}
 
-        self.setStyleSheet("""
-            QWidget {
-                background-color: #1e1e1e;
-                color: #ffffff;
-                font-family: Oswald;
-            }
-            QHeaderView::section {
-                background-color: #333;
-                color: white;
-                padding: 4px;
-                border: 1px solid #444;
-            }
-            QTableWidget {
-                background-color: #2a2a2a;
-                color: white;
-                gridline-color: #444;
-                selection-background-color: #3b82f6;
-                selection-color: black;
-            }
-            QTableWidget QTableCornerButton::section {
-                background-color: #333;
-                border: 1px solid #444;
-            }
-            QComboBox {
-                background-color: #2a2a2a;
-                color: white;
-            }
-            QComboBox QAbstractItemView {
-                background-color: #2a2a2a;
-                color: white;
-                selection-background-color: #3b82f6;
-                selection-color: black;
-            }
-            QPushButton {
-                background-color: #3b82f6;
-                color: white;
-                padding: 6px 12px;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #2563eb;
-            }
-            QLineEdit, QTextEdit {
-                background-color: #2a2a2a;
-                color: white;
-                border: 1px solid #444;
-                border-radius: 4px;
-                padding: 4px;
-            }
-            QLabel {
-                font-weight: bold;
-                color: white;
-            }
-        """
-        )
+        self.setStyleSheet(STYLESHEET)
 
         self.sort_config = DEFAULT_RULES.copy()
         self.current_config_name = DEFAULT_CONFIG_NAME
@@ -117,11 +307,14 @@ class FileSorterGUI(QWidget):
         sidebar = QVBoxLayout()
         sidebar.addWidget(QLabel("Sorting Rules:"))
 
-        self.table = QTableWidget(0, 3)
-        self.table.setHorizontalHeaderLabels(["File Extension", "Folder Name", "Subfolder Rule"])
+        self.rules_model = RulesModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.rules_model)
+        self.table.setItemDelegateForColumn(2, SubfolderDelegate(self.table))
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.verticalHeader().setDefaultSectionSize(24)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
-        self.table.setEditTriggers(QAbstractItemView.DoubleClicked)
+        self.table.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.SelectedClicked)
         self.table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self.show_context_menu)
         sidebar.addWidget(self.table)
@@ -157,9 +350,6 @@ class FileSorterGUI(QWidget):
         sidebar.addWidget(create_btn)
         sidebar.addWidget(delete_config_btn)
 
-        self.populate_table()  # empty table initially
-        QTimer.singleShot(0, self.load_available_configs)
-
         main_area = QVBoxLayout()
 
         behavior_layout = QHBoxLayout()
@@ -183,18 +373,36 @@ class FileSorterGUI(QWidget):
         main_area.addLayout(folder_layout)
 
         btn_layout = QHBoxLayout()
-        sort_btn = QPushButton("Sort Files")
-        sort_btn.clicked.connect(self.sort_files)
-        undo_btn = QPushButton("Undo Last Sort")
-        undo_btn.clicked.connect(self.undo_sort)
-        btn_layout.addWidget(sort_btn)
-        btn_layout.addWidget(undo_btn)
+        self.sort_btn = QPushButton("Sort Files")
+        self.sort_btn.clicked.connect(self.sort_files)
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.clicked.connect(self.stop_sort)
+        self.stop_btn.setEnabled(False)
+        self.undo_btn = QPushButton("Undo Last Sort")
+        self.undo_btn.clicked.connect(self.undo_sort)
+        btn_layout.addWidget(self.sort_btn)
+        btn_layout.addWidget(self.stop_btn)
+        btn_layout.addWidget(self.undo_btn)
         main_area.addLayout(btn_layout)
 
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1)
+        self.progress_bar.setValue(0)
+        self.progress_label = QLabel("")
+        main_area.addWidget(self.progress_bar)
+        main_area.addWidget(self.progress_label)
+        self.sort_worker = None
+
         main_area.addWidget(QLabel("Log Output:"))
-        self.log_output = QTextEdit()
+        self.log_output = QPlainTextEdit()
         self.log_output.setReadOnly(True)
+        self.log_output.setMaximumBlockCount(LOG_MAX_LINES)
         main_area.addWidget(self.log_output)
+        self.pending_log = []
+        self.log_timer = QTimer(self)
+        self.log_timer.setSingleShot(True)
+        self.log_timer.setInterval(LOG_FLUSH_MS)
+        self.log_timer.timeout.connect(self.flush_log)
 
         sidebar_widget = QWidget()
         sidebar_widget.setLayout(sidebar)
@@ -205,68 +413,55 @@ class FileSorterGUI(QWidget):
         main_widget.setLayout(main_area)
         main_layout.addWidget(main_widget)
 
+        self.log_message.connect(self.log)
         self.populate_table()
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.after_first_paint:
+            for callback in self.after_first_paint:
+                QTimer.singleShot(0, callback)
+            self.after_first_paint = None
+
+    def load_font(self):
+        font_id = QFontDatabase.addApplicationFont(resource_path("Oswald-Regular.ttf"))
+        families = QFontDatabase.applicationFontFamilies(font_id)
+        if families:
+            self.setFont(QFont(families[0], 10))
+        else:
+            print("⚠️ Oswald font not found. Falling back to default.")
+            self.setFont(QFont("Arial", 10))
+
     def delete_selected_rule(self):
         selected_rows = self.table.selectionModel().selectedRows()
         if not selected_rows:
             return
-
-        for model_index in sorted(selected_rows, key=lambda x: x.row(), reverse=True):
-            row = model_index.row()
-            ext_item = self.table.item(row, 0)
-            ext = ext_item.text().strip().lower() if ext_item else None
-            if ext and ext in self.sort_config:
-                del self.sort_config[ext]
-            self.table.removeRow(row)
+        self.rules_model.remove_rows(index.row() for index in selected_rows)
         self.log(f"Deleted {len(selected_rows)} rule(s).")
 
     def show_context_menu(self, pos):
         menu = QMenu(self)
 
-        menu.setStyleSheet("""
-        QMenu {
-            background-color: #2a2a2a;
-            color: white;
-            border: 1px solid #444;
-        }
-        QMenu::item {
-            background-color: transparent;
-            padding: 6px 20px;
-        }
-        QMenu::item:selected {
-            background-color: #FFFFFF; 
-            color: black;
-        }
-    """)
+        menu.setStyleSheet(MENU_STYLESHEET)
         
-        delete_action = menu.addAction(QIcon(resource_path("icons/delete.svg")), "Delete Selected Rule(s)")
-        duplicate_action = menu.addAction(QIcon(resource_path("icons/duplicate.svg")), "Duplicate Selected Rule")
+        delete_action = menu.addAction(self.icon("delete.svg"), "Delete Selected Rule(s)")
+        duplicate_action = menu.addAction(self.icon("duplicate.svg"), "Duplicate Selected Rule")
         action = menu.exec_(self.table.viewport().mapToGlobal(pos))
         if action == delete_action:
             self.delete_selected_rule()
         elif action == duplicate_action:
             self.duplicate_selected_rule()
 
+    def icon(self, name):
+        # Icons are loaded on first use and kept
+        if name not in self.icons:
+            self.icons[name] = QIcon(resource_path(f"icons/{name}"))
+        return self.icons[name]
+
     def duplicate_selected_rule(self):
-        selected = self.table.selectionModel().selectedRows()
-        for index in selected:
-            row = index.row()
-            ext = self.table.item(row, 0).text()
-            folder = self.table.item(row, 1).text()
-            subfolder_widget = self.table.cellWidget(row, 2)
-            subfolder = subfolder_widget.currentText() if subfolder_widget else "None"
-
-            self.add_rule_row()
-            new_row = self.table.rowCount() - 1
-            self.table.setItem(new_row, 0, QTableWidgetItem(ext))
-            self.table.setItem(new_row, 1, QTableWidgetItem(folder))
-            new_combo = QComboBox()
-            new_combo.addItems(["None", "Year", "MusicType"])
-            new_combo.setCurrentText(subfolder)
-            new_combo.setFocusPolicy(Qt.NoFocus)
-            new_combo.installEventFilter(self)
-            self.table.setCellWidget(new_row, 2, new_combo)
+        for index in self.table.selectionModel().selectedRows():
+            ext, rule = self.rules_model.rule_at(index.row())
+            self.rules_model.append_rule(ext, rule)
 
     def browse_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Select Folder")
@@ -274,34 +469,12 @@ class FileSorterGUI(QWidget):
             self.folder_input.setText(folder)
 
     def add_rule_row(self):
-        row_pos = self.table.rowCount()
-        self.table.insertRow(row_pos)
-        self.table.setItem(row_pos, 0, QTableWidgetItem(".ext"))
-        self.table.setItem(row_pos, 1, QTableWidgetItem("FolderName"))
-        combo = QComboBox()
-        combo.addItems(["None", "Year", "MusicType"])
-        combo.setFocusPolicy(Qt.NoFocus)
-        combo.installEventFilter(self)
-        self.table.setCellWidget(row_pos, 2, combo)
-
-    def eventFilter(self, source, event):
-        if event.type() == event.Wheel and isinstance(source, QComboBox):
-            return True
-        return super().eventFilter(source, event)
+        self.rules_model.append_rule(".ext", {"folder": "FolderName", "subfolder": None})
+        self.table.scrollToBottom()
 
     def save_current_config(self):
         config_name = self.config_selector.currentText()
-        config = {}
-        for row in range(self.table.rowCount()):
-            ext_item = self.table.item(row, 0)
-            folder_item = self.table.item(row, 1)
-            subfolder_widget = self.table.cellWidget(row, 2)
-            if not ext_item or not folder_item:
-                continue
-            ext = ext_item.text().strip().lower()
-            folder = folder_item.text().strip()
-            subfolder = subfolder_widget.currentText().lower() if subfolder_widget else None
-            config[ext] = {"folder": folder, "subfolder": subfolder if subfolder != "none" else None}
+        config = self.rules_model.to_config()
 
         path = os.path.join(CONFIG_DIR, f"{config_name}.json")
         with open(path, "w") as f:
@@ -331,6 +504,7 @@ class FileSorterGUI(QWidget):
             return
         with open(path, "w") as f:
             json.dump(DEFAULT_RULES, f, indent=2)
+        self.config_names.append(name)
         self.config_selector.addItem(name)
         self.config_selector.setCurrentText(name)
         self.new_config_input.clear()
@@ -344,15 +518,27 @@ class FileSorterGUI(QWidget):
         path = os.path.join(CONFIG_DIR, f"{name}.json")
         if os.path.exists(path):
             os.remove(path)
-        self.load_available_configs()
+        if name in self.config_names:
+            self.config_names.remove(name)
+            self.config_selector.removeItem(self.config_selector.findText(name))
         self.config_selector.setCurrentText(DEFAULT_CONFIG_NAME)
         self.log(f"Deleted config: {name}")
 
     def load_available_configs(self):
+        # CONFIG_DIR is listed once; creating and deleting templates keeps
+        # the list up to date. Signals are held back while the combo box is
+        # filled, so only the selected template is read.
+        if self.config_names is None:
+            self.config_names = sorted(name[:-5] for name in os.listdir(CONFIG_DIR) if name.endswith(".json"))
+        self.config_selector.blockSignals(True)
         self.config_selector.clear()
-        for filename in os.listdir(CONFIG_DIR):
-            if filename.endswith(".json"):
-                self.config_selector.addItem(filename[:-5])
+        self.config_selector.addItems(self.config_names)
+        if self.config_names:
+            current = self.current_config_name
+            self.config_selector.setCurrentText(current if current in self.config_names else self.config_names[0])
+        self.config_selector.blockSignals(False)
+        if self.config_names:
+            self.load_selected_config(self.config_selector.currentText())
 
     def reset_to_default(self):
         self.sort_config = DEFAULT_RULES.copy()
@@ -360,21 +546,7 @@ class FileSorterGUI(QWidget):
         self.log("Reset to default rules.")
 
     def populate_table(self):
-        self.table.setRowCount(0)
-        for ext, rule in self.sort_config.items():
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.table.setItem(row, 0, QTableWidgetItem(ext))
-            self.table.setItem(row, 1, QTableWidgetItem(rule.get("folder", "")))
-            combo = QComboBox()
-            combo.addItems(["None", "Year"])
-            if ext == ".mp3":
-                combo.addItem("MusicType")
-            current = rule.get("subfolder", "none")
-            combo.setCurrentText(current.capitalize() if current else "None")
-            combo.setFocusPolicy(Qt.NoFocus)
-            combo.installEventFilter(self)
-            self.table.setCellWidget(row, 2, combo)
+        self.rules_model.set_config(self.sort_config)
 
     def sort_files(self):
         folder = self.folder_input.text().strip()
@@ -384,11 +556,57 @@ class FileSorterGUI(QWidget):
         self.save_current_config()
         self.log("Sorting started...")
         behavior = self.behavior_combo.currentText()
-        threading.Thread(target=self._sort_thread, args=(folder, behavior), daemon=True).start()
 
-    def _sort_thread(self, folder, behavior):
-        summary = scan_and_sort(folder, self.sort_config, behavior)
-        self.log("Sorting complete.")
+        self.sort_worker = SortWorker(folder, dict(self.sort_config), behavior)
+        self.sort_worker.lines.connect(self.log_lines)
+        self.sort_worker.progress.connect(self.show_progress)
+        self.sort_worker.finished.connect(self.sort_finished)
+        self.sort_btn.setEnabled(False)
+        self.undo_btn.setEnabled(False)
+        self.stop_btn.setEnabled(True)
+        # Busy indicator until the size of the plan is known
+        self.progress_bar.setRange(0, 0)
+        self.progress_label.setText("Scanning...")
+        threading.Thread(target=self.sort_worker.run, daemon=True).start()
+
+    def stop_sort(self):
+        if self.sort_worker is not None:
+            self.sort_worker.cancel.set()
+            self.stop_btn.setEnabled(False)
+            self.log("Stopping after the moves in progress...")
+
+    def show_progress(self, progress):
+        done = progress["done"]
+        seconds = progress["seconds"]
+        rate = done / seconds if seconds else 0.0
+        text = f"{done:,} moved  ·  {rate:,.0f} files/s"
+        total = progress["total"]
+        if total:
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(done)
+            if rate and done < total:
+                text += f"  ·  ETA {format_duration((total - done) / rate)}"
+        else:
+            text += f"  ·  {progress['planned']:,} planned"
+        if progress["errors"]:
+            text += f"  ·  {progress['errors']:,} errors"
+        self.progress_label.setText(text)
+
+    def sort_finished(self, summary):
+        self.sort_worker = None
+        self.sort_btn.setEnabled(True)
+        self.undo_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
+        if self.progress_bar.maximum() == 0:
+            self.progress_bar.setRange(0, 1)
+            self.progress_bar.setValue(1)
+        if summary.get("status") == "failed":
+            self.log(f"Sorting failed: {summary['error']}")
+            return
+        if summary.get("status") == "cancelled":
+            self.log("Sorting stopped. Moves made so far can be undone.")
+        else:
+            self.log("Sorting complete.")
         if summary:
             self.log("\n--- Summary ---")
             for k, v in summary.items():
@@ -399,14 +617,30 @@ class FileSorterGUI(QWidget):
         threading.Thread(target=self._undo_thread, daemon=True).start()
 
     def _undo_thread(self):
+        from undo_sort import undo_moves
         undo_moves()
-        self.log("Undo complete.")
+        self.log_message.emit("Undo complete.")
+
+    def log_lines(self, lines):
+        self.pending_log.extend(lines)
+        if len(self.pending_log) > LOG_MAX_LINES:
+            del self.pending_log[:-LOG_MAX_LINES]
+        if not self.log_timer.isActive():
+            self.log_timer.start()
+
+    def flush_log(self):
+        if self.pending_log:
+            self.log_output.appendPlainText("\n".join(self.pending_log))
+            self.pending_log = []
 
     def log(self, message):
-        self.log_output.append(message)
+        self.log_lines([message])
     
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     gui = FileSorterGUI()
+    if "--startup-timing" in sys.argv:
+        # Report once the window has painted, then exit
+        gui.after_first_paint.insert(0, lambda: (startup_timing.report(), app.quit()))
     gui.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -26,7 +26,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # UPX-packed Qt libraries have to be unpacked on every launch
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
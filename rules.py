@@ -0,0 +1,196 @@
+import re
+import time
+import fnmatch
+
+# Rule keys, as written in sort_config.json and the GUI templates:
+#   ".pdf", ".tar.gz"     suffix rules, matched case-insensitively
+#   "Screenshot*.png"     glob on the file name (any key with * ? or [)
+#   "re:^IMG_\d+\.jpe?g$" regular expression on the file name
+#
+# Besides "folder" and "subfolder", a rule may carry conditions that must
+# all hold for it to apply:
+#   "min_size" / "max_size"                bytes, or strings like "10MB"
+#   "older_than_days" / "newer_than_days"  age by modification time
+#
+# "subfolder" is "year", "month" (2024/03) or "day" (2024/03/15) to file by
+# date, or "musictype". Date subfolders use the file's creation time where
+# the platform records one, its modification time otherwise; with
+# "metadata_date": true the EXIF capture date of photos and the creation
+# date of PDFs come first.
+#
+# Name patterns are tried first, in config order, then suffix rules from
+# the longest matching suffix down. The first rule whose conditions hold
+# wins.
+
+_RULES = object()
+_CONDITION_KEYS = ("min_size", "max_size", "older_than_days", "newer_than_days")
+_SIZE_UNITS = {"": 1, "B": 1}
+for _power, _unit in enumerate("KMGT", 1):
+    # "10M" is read the same as "10MB"
+    _SIZE_UNITS[_unit] = _SIZE_UNITS[_unit + "B"] = 1024 ** _power
+
+def parse_size(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?B?)\s*", str(value).upper())
+    if not match:
+        raise ValueError(f"Invalid size: {value!r}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+def _compile_conditions(rule, now):
+    conditions = []
+    if rule.get("min_size") is not None:
+        min_size = parse_size(rule["min_size"])
+        conditions.append(lambda st: st.st_size >= min_size)
+    if rule.get("max_size") is not None:
+        max_size = parse_size(rule["max_size"])
+        conditions.append(lambda st: st.st_size <= max_size)
+    if rule.get("older_than_days") is not None:
+        cutoff = now - float(rule["older_than_days"]) * 86400
+        conditions.append(lambda st: st.st_mtime < cutoff)
+    if rule.get("newer_than_days") is not None:
+        cutoff = now - float(rule["newer_than_days"]) * 86400
+        conditions.append(lambda st: st.st_mtime >= cutoff)
+    return conditions
+
+def _holds(conditions, stat):
+    if not conditions:
+        return True
+    st = stat()
+    return all(condition(st) for condition in conditions)
+
+def _glob_affixes(pattern):
+    # Literal text every match must start and end with: everything before
+    # the first wildcard and after the last one (or after a "[...]" class).
+    first = min((pattern.find(c) for c in "*?[" if c in pattern), default=len(pattern))
+    last = max(pattern.rfind(c) for c in "*?]")
+    return pattern[:first], pattern[last + 1:]
+
+def _trie_insert(trie, text, value):
+    node = trie
+    for char in text:
+        node = node.setdefault(char, {})
+    node.setdefault(_RULES, []).append(value)
+
+def _trie_hits(trie, text):
+    hits = []
+    node = trie
+    for char in text:
+        node = node.get(char)
+        if node is None:
+            break
+        hits.extend(node.get(_RULES, ()))
+    return hits
+
+class RuleMatcher:
+    """A sort config compiled into a single matcher.
+
+    Suffix rules live in a trie keyed by the dot-separated name parts read
+    from the right, so a lookup costs one step per suffix part no matter
+    how many rules there are. Globs are indexed by their literal prefix
+    (or, for globs starting with a wildcard, their literal ending) in
+    character tries, so only globs that can possibly match a name are
+    tried. Regexes and globs with no literal anchor are folded into one
+    combined regex that rejects most names in a single pass.
+    """
+
+    def __init__(self, config):
+        now = time.time()
+        self.config = config
+        self.trie = {}
+        self.patterns = []
+        self.prefix_trie = {}
+        self.ending_trie = {}
+        unanchored = []
+        for key, rule in config.items():
+            entry = (key, rule, _compile_conditions(rule, now))
+            if key.startswith("re:"):
+                unanchored.append(len(self.patterns))
+                self.patterns.append((re.compile(key[3:]), entry))
+            elif any(c in key for c in "*?["):
+                glob = key.lower()
+                prefix, ending = _glob_affixes(glob)
+                if prefix:
+                    _trie_insert(self.prefix_trie, prefix, len(self.patterns))
+                elif ending:
+                    _trie_insert(self.ending_trie, ending[::-1], len(self.patterns))
+                else:
+                    unanchored.append(len(self.patterns))
+                self.patterns.append((re.compile(fnmatch.translate(glob), re.IGNORECASE), entry))
+            elif key.startswith("."):
+                node = self.trie
+                for part in reversed(key.lower().split(".")[1:]):
+                    node = node.setdefault(part, {})
+                node.setdefault(_RULES, []).append(entry)
+
+        # Keys of rules with size or age conditions: a file they reject today
+        # may match once it has grown or is older (or no longer new enough).
+        self.conditional = {key for key, rule in config.items()
+                            if any(rule.get(name) is not None for name in _CONDITION_KEYS)}
+        self.unanchored = unanchored
+        self.any_unanchored = None
+        if unanchored:
+            combined = "|".join(f"(?:{self.patterns[i][0].pattern})" for i in unanchored)
+            try:
+                self.any_unanchored = re.compile(combined, re.IGNORECASE)
+            except re.error:
+                # Patterns using inline flags or backreferences cannot be
+                # combined; they are then tried one by one.
+                self.any_unanchored = None
+
+    def _pattern_candidates(self, name):
+        lower = name.lower()
+        candidates = _trie_hits(self.prefix_trie, lower)
+        candidates += _trie_hits(self.ending_trie, lower[::-1])
+        if self.unanchored and (self.any_unanchored is None or self.any_unanchored.match(name)):
+            candidates += self.unanchored
+        return sorted(candidates)
+
+    def match(self, name, stat):
+        # Returns (key, rule) for the first applicable rule, or None.
+        # `stat` is a callable returning the file's stat result; it is only
+        # called when a candidate rule has size or age conditions.
+        if self.patterns:
+            for i in self._pattern_candidates(name):
+                pattern, (key, rule, conditions) = self.patterns[i]
+                if pattern.match(name) and _holds(conditions, stat):
+                    return key, rule
+
+        for entries in reversed(self._suffix_candidates(name)):
+            for key, rule, conditions in entries:
+                if _holds(conditions, stat):
+                    return key, rule
+        return None
+
+    def _suffix_candidates(self, name):
+        parts = name.lower().split(".")
+        # The stem is never a suffix; a leading dot belongs to the stem
+        # (".bashrc" has no suffix, as with os.path.splitext).
+        stem_parts = 2 if parts[0] == "" else 1
+        node = self.trie
+        candidates = []
+        for part in reversed(parts[stem_parts:]):
+            node = node.get(part)
+            if node is None:
+                break
+            if _RULES in node:
+                candidates.append(node[_RULES])
+        return candidates
+
+    def is_conditional(self, name):
+        # True if a rule with a size or age condition could apply to `name`.
+        # The answer for such a file changes as time passes or the file is
+        # written to, neither of which touches its directory's mtime, so it
+        # must not be remembered as unsortable.
+        if not self.conditional:
+            return False
+        for i in self._pattern_candidates(name) if self.patterns else ():
+            pattern, (key, rule, conditions) = self.patterns[i]
+            if key in self.conditional and pattern.match(name):
+                return True
+        return any(key in self.conditional for entries in self._suffix_candidates(name) for key, _, _ in entries)
+
+def compile_rules(config):
+    if isinstance(config, RuleMatcher):
+        return config
+    return RuleMatcher(config)
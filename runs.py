@@ -0,0 +1,76 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+from journal import LOG_DIR, MoveJournal
+
+RUNS_DIR = LOG_DIR / "runs"
+# One small record per run; later records for the same id update earlier ones.
+RUN_INDEX_PATH = LOG_DIR / "runs.jsonl"
+
+def config_hash(config):
+    if config is None:
+        return None
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+def journal_path(run_id):
+    return RUNS_DIR / f"{run_id}.jsonl"
+
+def _append_record(record):
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    with open(RUN_INDEX_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def start_run(folder, config=None, behavior=None):
+    # Registers the run before any move is made, so even a run that crashes
+    # halfway shows up in the history and can be undone.
+    started = datetime.now()
+    run_id = started.strftime("%Y%m%d-%H%M%S-") + os.urandom(3).hex()
+    record = {
+        "id": run_id,
+        "started": started.isoformat(timespec="seconds"),
+        "folder": str(folder),
+        "behavior": behavior,
+        "config_hash": config_hash(config),
+        "status": "running",
+    }
+    _append_record(record)
+    journal = MoveJournal(journal_path(run_id), header={"type": "run", **record})
+    return run_id, journal
+
+def finish_run(run_id, stats, status="complete"):
+    # status is "complete", or "cancelled" for a run stopped part way.
+    _append_record({"id": run_id, "status": status, "stats": stats})
+
+def mark_undone(run_id):
+    _append_record({"id": run_id, "status": "undone", "undone": datetime.now().isoformat(timespec="seconds")})
+
+def list_runs():
+    # All runs, oldest first (the order they were registered in).
+    runs = {}
+    try:
+        with open(RUN_INDEX_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                runs.setdefault(record["id"], {}).update(record)
+    except OSError:
+        pass
+    return list(runs.values())
+
+def get_run(run_id):
+    for run in list_runs():
+        if run["id"] == run_id:
+            return run
+    return None
+
+def undoable_runs():
+    # Newest first, skipping runs that were already undone and runs that
+    # finished without moving anything (an --incremental re-sort or a watch
+    # rescan with nothing new). A run that crashed has no stats and is kept.
+    return [run for run in reversed(list_runs())
+            if run.get("status") != "undone" and run.get("stats", {}).get("moves") != 0]
@@ -0,0 +1,80 @@
+import json
+import sqlite3
+import hashlib
+from pathlib import Path
+from journal import LOG_DIR
+
+INDEX_DIR = LOG_DIR / "index"
+
+class ScanIndex:
+    """Persistent record of what a folder looked like after the last sort.
+
+    Files are keyed by path, size, mtime and inode; a file whose key is
+    unchanged was already classified and left in place, so it is skipped.
+    Directories are keyed by mtime and inode together with their list of
+    subdirectories, so a directory whose entries have not changed is not
+    listed at all. The index is tied to the rules, behaviour and options
+    it was built with and is discarded when any of them changes.
+    """
+
+    def __init__(self, folder, config, behavior, options=None):
+        self.folder = str(Path(folder).resolve())
+        INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        name = hashlib.sha1(self.folder.encode("utf-8")).hexdigest()[:16]
+        self.db = sqlite3.connect(str(INDEX_DIR / f"{name}.sqlite"), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER);
+            CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER, inode INTEGER, subdirs TEXT);
+        """)
+        signature = hashlib.sha1(json.dumps([config, behavior, options], sort_keys=True).encode("utf-8")).hexdigest()
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        if row is None or row[0] != signature:
+            self.clear()
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (signature,))
+        self.pending_files = []
+        self.pending_dirs = []
+
+    def clear(self):
+        self.db.execute("DELETE FROM files")
+        self.db.execute("DELETE FROM dirs")
+
+    def unchanged_subdirs(self, path, st):
+        # Returns the stored subdirectories if the directory is unchanged
+        # since it was last listed, otherwise None.
+        row = self.db.execute("SELECT mtime_ns, inode, subdirs FROM dirs WHERE path = ?", (path,)).fetchone()
+        if row is None or row[0] != st.st_mtime_ns or row[1] != st.st_ino:
+            return None
+        return row[2].split("\0") if row[2] else []
+
+    def record_dir(self, path, st, subdirs):
+        # st must be taken before the directory is listed, so a change made
+        # while the sort runs forces a relisting.
+        self.pending_dirs.append((path, st.st_mtime_ns, st.st_ino, "\0".join(subdirs)))
+
+    def is_known(self, entry):
+        row = self.db.execute("SELECT size, mtime_ns, inode FROM files WHERE path = ?", (entry.path,)).fetchone()
+        if row is None:
+            return False
+        st = entry.stat()
+        return row == (st.st_size, st.st_mtime_ns, entry.inode())
+
+    def remember(self, entry):
+        st = entry.stat()
+        self.pending_files.append((entry.path, st.st_size, st.st_mtime_ns, entry.inode()))
+        if len(self.pending_files) >= 1000:
+            self.flush()
+
+    def flush(self):
+        # Writes go into the open transaction; nothing is committed until close().
+        self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", self.pending_files)
+        self.db.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", self.pending_dirs)
+        self.pending_files = []
+        self.pending_dirs = []
+
+    def close(self):
+        # Only a completed run updates the index; an interrupted one leaves
+        # the previous state in place and everything is checked again.
+        self.flush()
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,96 @@
+import os
+from cache import PersistentLRU
+from journal import LOG_DIR
+
+HEADER_BYTES = 512
+# Header reads are I/O bound; this many run at once even for a serial sort.
+SNIFF_THREADS = 8
+
+# Extensions a file of each detected type may legitimately carry; a file
+# whose own suffix is in the set keeps being sorted by its name.
+KNOWN_EXTENSIONS = {
+    ".pdf": {".pdf", ".ai"},
+    ".png": {".png", ".apng"},
+    ".jpg": {".jpg", ".jpeg", ".jpe", ".jfif"},
+    ".zip": {".zip", ".docx", ".xlsx", ".pptx", ".epub", ".odt", ".ods", ".odp", ".jar", ".apk", ".cbz", ".whl"},
+    ".docx": {".docx", ".docm", ".dotx"},
+    ".epub": {".epub"},
+    ".mp3": {".mp3"},
+    ".exe": {".exe", ".dll", ".sys", ".scr", ".com", ".cpl", ".ocx"},
+}
+
+# Renamed whenever detect_type changes its answers, so stale results are dropped
+sniff_cache = PersistentLRU(LOG_DIR / "sniff_cache_v2.json")
+
+def _mpeg_audio_header(header):
+    # A bare MPEG layer III frame header (an MP3 without an ID3 tag). Frame
+    # sync alone is not enough: FF FE is also the UTF-16 LE byte order mark,
+    # so version, layer, bitrate and sample rate must all be valid too.
+    if len(header) < 3 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return False
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate = header[2] >> 4
+    sample_rate = (header[2] >> 2) & 0x03
+    return version != 1 and layer == 1 and bitrate not in (0, 15) and sample_rate != 3
+
+def detect_type(header):
+    # Maps the first bytes of a file to an extension, or None.
+    if header.startswith(b"%PDF-"):
+        return ".pdf"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if header.startswith(b"PK\x03\x04"):
+        # The first member of the archive tells containers apart: EPUB
+        # stores "mimetype" first, Word documents lead with word/ parts.
+        name_len = int.from_bytes(header[26:28], "little")
+        first_name = header[30:30 + name_len]
+        if first_name == b"mimetype" and b"application/epub+zip" in header:
+            return ".epub"
+        if first_name.startswith(b"word/") or (first_name == b"[Content_Types].xml" and b"word/" in header):
+            return ".docx"
+        return ".zip"
+    if header.startswith(b"ID3"):
+        return ".mp3"
+    if _mpeg_audio_header(header):
+        return ".mp3"
+    if header.startswith(b"MZ"):
+        return ".exe"
+    return None
+
+def sniff_file(path, st, inode=None):
+    # Cached by (inode, size, mtime); only the header is ever read.
+    key = f"{inode or st.st_ino}\0{st.st_size}\0{st.st_mtime_ns}"
+    cached = sniff_cache.get(key)
+    if cached is not None:
+        return cached or None
+    try:
+        with open(path, "rb") as f:
+            detected = detect_type(f.read(HEADER_BYTES))
+    except OSError:
+        return None
+    sniff_cache.put(key, detected or "")
+    return detected
+
+def sniffed_name(entry, mode):
+    # The name to match rules against, or None to keep the file's own name.
+    # "missing" only sniffs files that no rule matched by name; "all" also
+    # catches files whose suffix disagrees with their content.
+    try:
+        detected = sniff_file(entry.path, entry.stat(), entry.inode())
+    except OSError:
+        return None
+    if detected is None:
+        return None
+    own = os.path.splitext(entry.name)[1].lower()
+    if mode == "all" and own in KNOWN_EXTENSIONS[detected]:
+        return None
+    return entry.name + detected
+
+def sniff_batch(entries, mode, pool):
+    # Reads the headers of a batch concurrently; returns {path: name} for
+    # the files whose content calls for a different name.
+    names = pool.map(sniffed_name, entries, [mode] * len(entries))
+    return {entry.path: name for entry, name in zip(entries, names) if name}
@@ -1,95 +1,1099 @@
 import os
 import json
+import time
+import errno
+import queue
 import shutil
-from pathlib import Path
+import threading
+import functools
+from collections import deque, namedtuple
 from datetime import datetime
-from mutagen.mp3 import MP3
-from mutagen.easyid3 import EasyID3
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from cache import PersistentLRU
+from rules import compile_rules
+import sniff
+import dedupe
+import dates
+from journal import LOG_DIR
+import runs
 
-move_history = []
+music_cache = PersistentLRU(LOG_DIR / "music_cache.json")
 
-def get_file_year(file_path):
-    try:
-        timestamp = os.path.getctime(file_path)
-    except Exception:
-        timestamp = os.path.getmtime(file_path)
-    dt = datetime.fromtimestamp(timestamp)
-    return str(dt.year)
+MUSIC_GENRES = ["pop", "rock", "hip hop", "electronic", "jazz", "classical"]
+# ID3v1 genre numbers for the genres above, as EasyID3 would spell them
+ID3V1_GENRES = {7: "Hip-Hop", 8: "Jazz", 13: "Pop", 17: "Rock", 32: "Classical", 52: "Electronic"}
+ID3_FRAMES = {
+    b"TIT2": "title", b"TPE1": "artist", b"TCON": "genre",
+    b"TT2": "title", b"TP1": "artist", b"TCO": "genre",
+}
+
+# Date subfolder kinds and the (possibly nested) folder each one files into
+DATE_SUBFOLDERS = {"year": "%Y", "month": "%Y" + os.sep + "%m", "day": "%Y" + os.sep + "%m" + os.sep + "%d"}
+
+def get_file_year(file_path, st=None):
+    if st is None:
+        st = os.stat(file_path)
+    return str(dates.file_date(file_path, st).year)
+
+def _decode_id3_text(data):
+    encoding, text = data[:1], data[1:]
+    codec = {b"\x00": "latin-1", b"\x01": "utf-16", b"\x02": "utf-16-be", b"\x03": "utf-8"}.get(encoding)
+    if codec is None:
+        return None
+    value = text.decode(codec, "replace").split("\x00")[0].strip()
+    return value or None
+
+def _genre_name(value):
+    # "(17)", "17" and "(17)Rock" style references to ID3v1 genres
+    if value and value.startswith("("):
+        number = value[1:value.find(")")]
+        rest = value[value.find(")") + 1:]
+        value = rest or number
+    if value and value.isdigit():
+        return ID3V1_GENRES.get(int(value), value)
+    return value
 
-def is_music(file_path):
+def read_id3_tags(file_path):
+    # Reads title/artist/genre from just the ID3 tag bytes: the 10-byte
+    # ID3v2 header, its frame headers and the three text frames, or the
+    # 128-byte ID3v1 trailer.
+    # Returns None for tag layouts it does not handle (unsynchronised or
+    # compressed frames) so the caller can fall back to mutagen.
+    tags = {}
+    with open(file_path, "rb") as f:
+        header = f.read(10)
+        if len(header) == 10 and header[:3] == b"ID3":
+            version, flags = header[3], header[5]
+            if version not in (2, 3, 4) or flags & 0x80:
+                return None
+            size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+            tag_end = 10 + size
+            if flags & 0x40:
+                raw = f.read(4)
+                if len(raw) < 4:
+                    return tags
+                if version == 4:
+                    f.seek(10 + ((raw[0] << 21) | (raw[1] << 14) | (raw[2] << 7) | raw[3]))
+                else:
+                    f.seek(int.from_bytes(raw, "big"), os.SEEK_CUR)
+            # Frame headers are read one at a time and the bodies of frames
+            # that are not needed (cover art, lyrics, ...) skipped with a seek
+            id_len, head_len = (3, 6) if version == 2 else (4, 10)
+            while f.tell() + head_len <= tag_end and len(tags) < 3:
+                frame_header = f.read(head_len)
+                frame_id = frame_header[:id_len]
+                if len(frame_header) < head_len or not frame_id.strip(b"\x00"):
+                    break
+                raw_size = frame_header[id_len:id_len + (3 if version == 2 else 4)]
+                if version == 4:
+                    frame_size = (raw_size[0] << 21) | (raw_size[1] << 14) | (raw_size[2] << 7) | raw_size[3]
+                else:
+                    frame_size = int.from_bytes(raw_size, "big")
+                # Compressed, encrypted or grouped frames (v2.3: 0xE0; v2.4:
+                # 0x4F, which also covers unsynchronised and length-prefixed
+                # ones) are left to mutagen
+                if version != 2 and frame_header[9] & (0xE0 if version == 3 else 0x4F):
+                    return None
+                name = ID3_FRAMES.get(frame_id)
+                if name and name not in tags:
+                    tags[name] = _decode_id3_text(f.read(min(frame_size, tag_end - f.tell())))
+                else:
+                    f.seek(frame_size, os.SEEK_CUR)
+            return tags
+
+        try:
+            f.seek(-128, os.SEEK_END)
+        except OSError:
+            return tags
+        trailer = f.read(128)
+        if trailer[:3] == b"TAG":
+            tags["title"] = trailer[3:33].split(b"\x00")[0].decode("latin-1").strip() or None
+            tags["artist"] = trailer[33:63].split(b"\x00")[0].decode("latin-1").strip() or None
+            tags["genre"] = str(trailer[127])
+        return tags
+
+def _read_tags_with_mutagen(file_path):
+    # Imported here so sorting without "musictype" rules never loads mutagen.
+    from mutagen.mp3 import MP3
+    from mutagen.easyid3 import EasyID3
+    audio = MP3(file_path, ID3=EasyID3)
+    return {name: audio.get(name, [None])[0] for name in ("title", "artist", "genre")}
+
+def is_music(file_path, st=None):
     try:
-        audio = MP3(file_path, ID3=EasyID3)
-        title = audio.get("title", [None])[0]
-        artist = audio.get("artist", [None])[0]
-        genre = audio.get("genre", [None])[0]
-        if title and artist:
-            return True
-        if genre and genre.lower() in ["pop", "rock", "hip hop", "electronic", "jazz", "classical"]:
-            return True
+        if st is None:
+            st = os.stat(file_path)
+        key = PersistentLRU.key(file_path, st)
+        cached = music_cache.get(key)
+        if cached is not None:
+            return cached
+
+        tags = read_id3_tags(file_path)
+        if tags is None:
+            tags = _read_tags_with_mutagen(file_path)
+        title = tags.get("title")
+        artist = tags.get("artist")
+        genre = _genre_name(tags.get("genre"))
+        result = bool(title and artist) or bool(genre and genre.lower() in MUSIC_GENRES)
+        music_cache.put(key, result)
+        return result
     except Exception:
         pass
     return False
 
-def record_move(src, dst, type_):
-    move_history.append({
-        "source": str(src),
-        "destination": str(dst),
-        "type": type_
-    })
-
-def move_file(file_path, target_dir):
-    target_dir.mkdir(parents=True, exist_ok=True)
-    target_path = target_dir / file_path.name
-    record_move(file_path, target_path, "file")
-    shutil.move(str(file_path), target_path)
-    print(f"Moved {file_path} -> {target_path}")
-
-def scan_and_sort(folder_path, config, behavior):
-    folder = Path(folder_path)
-    move_history.clear()
-    summary = {}
+def iter_files(folder, recursive=False, prune=(), index=None, on_error=None):
+    # Walks the tree with os.scandir and yields DirEntry objects for files.
+    # DirEntry caches the type (and on Windows the stat) from the directory
+    # listing, so no extra stat is spent per entry. Directories whose path
+    # is in `prune` are never entered. With a ScanIndex, unchanged
+    # directories are not listed and already-classified files are skipped.
+    # A directory that cannot be listed is passed to on_error(path, error),
+    # or printed without one, and the walk goes on.
+    pending = [str(folder)]
+    while pending:
+        current = pending.pop()
+        if index is not None:
+            try:
+                dir_st = os.stat(current)
+            except OSError:
+                continue
+            known = index.unchanged_subdirs(current, dir_st)
+            if known is not None:
+                pending.extend(d for d in known if d not in prune)
+                continue
+        subdirs = []
+        settled = True
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file():
+                            if index is None or not index.is_known(entry):
+                                settled = False
+                                yield entry
+                        elif recursive and entry.is_dir(follow_symlinks=False) and entry.path not in prune:
+                            subdirs.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError as e:
+            if on_error is None:
+                print(f"Error scanning {current}: {e}")
+            else:
+                on_error(current, e)
+            continue
+        # A directory is only marked unchanged once a listing finds nothing
+        # new in it, so files whose move failed are retried next run.
+        if index is not None and settled:
+            index.record_dir(current, dir_st, subdirs)
+        pending.extend(subdirs)
 
-    # --- Handle pre-existing folders ---
-    if behavior == "Move pre-existing folders to archive":
-        archive_path = folder / "Archived_Folders"
-        archive_path.mkdir(exist_ok=True)
-
-        for item in folder.iterdir():
-            if item.is_dir() and item != archive_path and item.name not in [rule["folder"] for rule in config.values()]:
-                target = archive_path / item.name
-                record_move(item, target, "folder")
-                shutil.move(str(item), target)
-                # Add to summary using relative path
-                rel_path = target.relative_to(folder)
-                summary[str(rel_path)] = summary.get(str(rel_path), 0) + len(list(target.rglob("*")))
-
-    # --- Gather files to sort ---
-    if behavior == "Sort contents of pre-existing folders":
-        files = [f for f in folder.rglob("*") if f.is_file()]
+class _PathEntry:
+    # Stands in for an os.DirEntry when files are known by path alone, as
+    # in watch mode; the stat is taken once, on first use.
+    __slots__ = ("path", "name", "_stat")
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def inode(self):
+        return self.stat().st_ino
+
+def count_entries(path):
+    # Number of files and folders under path, counted from the directory
+    # listings alone; symlinked folders are not followed.
+    count = 0
+    pending = [path]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as it:
+                for entry in it:
+                    count += 1
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return count
+
+def iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_typed_batches(moves, size):
+    # Like iter_batches, but a batch never mixes move types, so folder and
+    # link moves are always in place before or after the files around
+    # them, never racing them.
+    for batch in iter_batches(moves, size):
+        current = []
+        for move in batch:
+            if current and current[-1].type != move.type:
+                yield current
+                current = []
+            current.append(move)
+        if current:
+            yield current
+
+COPY_BUFSIZE = 8 * 1024 * 1024
+
+def _copy_file(src, dst):
+    # Cross-device copy in large chunks, letting the kernel move the data
+    # (copy_file_range, then sendfile) where it can. Some file systems
+    # report 0 bytes on the first kernel copy; those fall through to the
+    # next method. Raises OSError unless the whole file was copied, so a
+    # source is never removed behind a short copy.
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        infd, outfd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(infd).st_size
+        copied = 0
+        for kernel_copy in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+            if kernel_copy is None or copied:
+                continue
+            try:
+                while True:
+                    if kernel_copy is os.sendfile:
+                        sent = os.sendfile(outfd, infd, copied, COPY_BUFSIZE)
+                    else:
+                        sent = os.copy_file_range(infd, outfd, COPY_BUFSIZE)
+                    if sent == 0:
+                        break
+                    copied += sent
+            except OSError:
+                if copied:
+                    raise
+        if not copied:
+            fsrc.seek(0)
+            shutil.copyfileobj(fsrc, fdst, COPY_BUFSIZE)
+            copied = fdst.tell()
+    if copied != size:
+        raise OSError(errno.EIO, f"copied {copied} of {size} bytes")
+    shutil.copystat(src, dst)
+    return copied
+
+def _move_group(target_dir, moves, created_dirs=None, metrics=None, cancel=None):
+    # Runs on a worker: performs every planned move bound for one directory,
+    # in order. Returns (move, error, path) tuples, where path says how the
+    # move was done, so the caller can record history and throughput from a
+    # single thread.
+    #
+    # Files are renamed in place when source and target share a device.
+    # Files that turn out to be on another device are copied once the
+    # renames are done and their sources unlinked together afterwards.
+    # With a Metrics, mkdir and every kind of move are timed. Once `cancel`
+    # is set no further move or copy is started; the moves not started are
+    # left out of the results.
+    clock = time.perf_counter
+    if created_dirs is None or target_dir not in created_dirs:
+        started = clock() if metrics is not None else 0.0
+        try:
+            os.makedirs(target_dir, exist_ok=True)
+        except OSError as e:
+            return [(move, str(e), None) for move in moves]
+        if metrics is not None:
+            metrics.add("mkdir", clock() - started)
+        if created_dirs is not None:
+            created_dirs.add(target_dir)
+
+    results = []
+    cross_device = []
+    for move in moves:
+        if cancel is not None and cancel.is_set():
+            break
+        started = clock() if metrics is not None else 0.0
+        if move.type == "link":
+            try:
+                dedupe.link_duplicate(move.source, move.destination)
+            except OSError as e:
+                results.append((move, str(e), None))
+                continue
+            results.append((move, None, "link"))
+            if metrics is not None:
+                metrics.add("link", clock() - started)
+            continue
+        try:
+            if move.type == "file":
+                os.replace(move.source, move.destination)
+            else:
+                os.rename(move.source, move.destination)
+        except OSError as e:
+            if e.errno == errno.EXDEV and move.type == "file":
+                cross_device.append(move)
+                continue
+            if e.errno != errno.EXDEV:
+                results.append((move, str(e), None))
+                continue
+            try:
+                shutil.move(move.source, move.destination)
+            except OSError as e:
+                results.append((move, str(e), None))
+                continue
+            results.append((move, None, "fallback"))
+            if metrics is not None:
+                metrics.add("fallback", clock() - started)
+            continue
+        results.append((move, None, "rename"))
+        if metrics is not None:
+            metrics.add("rename", clock() - started)
+
+    copied = []
+    for move in cross_device:
+        if cancel is not None and cancel.is_set():
+            break
+        started = clock() if metrics is not None else 0.0
+        try:
+            _copy_file(move.source, move.destination)
+        except OSError as e:
+            try:
+                os.unlink(move.destination)
+            except OSError:
+                pass
+            results.append((move, str(e), None))
+            continue
+        copied.append(move)
+        if metrics is not None:
+            metrics.add("copy", clock() - started)
+    for move in copied:
+        try:
+            os.unlink(move.source)
+        except OSError as e:
+            results.append((move, f"copied but source not removed: {e}", None))
+            continue
+        results.append((move, None, "copy"))
+    return results
+
+class MoveExecutor:
+    """Runs planned moves on a bounded pool of worker lanes.
+
+    Every target directory is pinned to one single-worker lane, so moves
+    into the same directory always happen in the order they were planned
+    while different directories proceed in parallel.
+    """
+
+    def __init__(self, workers=1, pool="thread", io_limit=None, metrics=None, cancel=None):
+        self.workers = max(1, workers)
+        if pool == "process":
+            # multiprocessing is only imported when process lanes are asked for
+            from concurrent.futures import ProcessPoolExecutor as pool_cls
+        else:
+            pool_cls = ThreadPoolExecutor
+        self.lanes = [] if self.workers == 1 else [pool_cls(max_workers=1) for _ in range(self.workers)]
+        self.pending = set()
+        self.max_pending = self.workers * 4
+        # Directories already created this run; process lanes cannot share it.
+        self.created_dirs = None if pool == "process" and self.lanes else set()
+        # A semaphore shared by every executor in the process bounds how many
+        # directories are being moved into at once, across concurrent sorts.
+        # Process lanes cannot share it.
+        self.io_limit = None if pool == "process" and self.lanes else io_limit
+        # Timings recorded in another process would be lost
+        self.metrics = None if pool == "process" and self.lanes else metrics
+        # Checked by the lanes between moves; process lanes cannot see it and
+        # only stop at group boundaries (see stop()).
+        self.cancel = None if pool == "process" and self.lanes else cancel
+
+    def submit(self, moves):
+        groups = {}
+        for move in moves:
+            groups.setdefault(os.path.dirname(move.destination), []).append(move)
+
+        move_group = _move_group if self.io_limit is None else self._limited_move_group
+        for target_dir, group in groups.items():
+            if not self.lanes:
+                yield target_dir, move_group(target_dir, group, self.created_dirs, self.metrics, self.cancel)
+                continue
+            lane = self.lanes[hash(target_dir) % len(self.lanes)]
+            future = lane.submit(move_group, target_dir, group, self.created_dirs, self.metrics, self.cancel)
+            future.target_dir = target_dir
+            self.pending.add(future)
+            if len(self.pending) >= self.max_pending:
+                yield from self._collect(FIRST_COMPLETED)
+
+    def _limited_move_group(self, target_dir, moves, created_dirs, metrics, cancel):
+        with self.io_limit:
+            return _move_group(target_dir, moves, created_dirs, metrics, cancel)
+
+    def stop(self):
+        # Drops the groups still queued on the lanes; groups already running
+        # finish their current move and are collected as usual.
+        for future in self.pending:
+            future.cancel()
+
+    def drain(self):
+        while self.pending:
+            yield from self._collect(FIRST_COMPLETED)
+
+    def finish(self):
+        yield from self.drain()
+        for lane in self.lanes:
+            lane.shutdown()
+
+    def _collect(self, return_when):
+        # Futures leave `pending` only as they are handed out, so a caller
+        # that stops iterating early (a cancelled run) still collects the
+        # rest from drain() and no finished move goes unrecorded.
+        done, _ = wait(self.pending, return_when=return_when)
+        for future in done:
+            self.pending.discard(future)
+            if not future.cancelled():
+                yield future.target_dir, future.result()
+
+# --- Planning ---
+
+PlannedMove = namedtuple("PlannedMove", ["source", "destination", "rule", "type", "size", "collision"])
+
+COLLISION_POLICIES = ("rename", "skip", "overwrite")
+
+def _folds_case(path):
+    # False only when the file system holding `path` is known to tell names
+    # apart by case: the nearest existing component with letters in its name
+    # is looked up again with its case swapped.
+    while True:
+        head, tail = os.path.split(path)
+        if not tail or head == path:
+            return True
+        swapped = tail.swapcase()
+        if swapped != tail:
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Not created yet; its parent decides
+                path = head
+                continue
+            try:
+                return os.path.samestat(st, os.stat(os.path.join(head, swapped)))
+            except OSError:
+                return False
+        path = head
+
+class _DestinationIndex:
+    # Per-run index of the names in every target directory: each directory
+    # is listed once, the first time a move is planned into it, and every
+    # planned move then claims its name, so collisions with existing files
+    # and with other moves of the same run are resolved without a stat.
+    #
+    # Policies: "rename" gives the newcomer the first free "name (n).ext",
+    # "skip" leaves it where it is, "overwrite" replaces a file that was
+    # there before the run (undo cannot bring that file back). Two moves of
+    # the same run never replace each other; under "overwrite" the later
+    # one is renamed. Folders are never merged into an existing folder;
+    # they are renamed unless the policy is "skip".
+    #
+    # Names are compared case-insensitively unless the directory's file
+    # system is found to be case-sensitive: on macOS (APFS, HFS+) and
+    # Windows "Report.pdf" and "report.pdf" are the same file.
+
+    def __init__(self, policy="rename"):
+        if policy not in COLLISION_POLICIES:
+            raise ValueError(f"Unknown collision policy: {policy!r}")
+        self.policy = policy
+        self.names = {}
+        self.keys = {}
+        # Last suffix handed out per (directory, name), so a long run of
+        # same-named files does not rescan from "(1)" every time.
+        self.suffixes = {}
+
+    def _listing(self, target_dir):
+        names = self.names.get(target_dir)
+        if names is None:
+            key = str.casefold if _folds_case(target_dir) else os.path.normcase
+            try:
+                names = dict.fromkeys(map(key, os.listdir(target_dir)), "exists")
+            except OSError:
+                names = {}
+            self.names[target_dir] = names
+            self.keys[target_dir] = key
+        return names
+
+    def claim(self, target_dir, name, type_="file"):
+        # Returns (destination, collision) for a move of `name` into
+        # target_dir, or None when the policy skips it. `collision` is
+        # "exists" or "planned" when the name was taken and the move was
+        # renamed, "overwrite" when it replaces an existing file, else None.
+        names = self._listing(target_dir)
+        fold = self.keys[target_dir]
+        key = fold(name)
+        status = names.get(key)
+        if status is not None:
+            if self.policy == "skip":
+                return None
+            if self.policy == "overwrite" and type_ == "file" and status == "exists":
+                names[key] = "replaced"
+                return target_dir + os.sep + name, "overwrite"
+            name = self._free_name(target_dir, names, name)
+            key = fold(name)
+            if status == "replaced":
+                status = "planned"
+        names[key] = "planned"
+        return target_dir + os.sep + name, status
+
+    def _free_name(self, target_dir, names, name):
+        stem, ext = os.path.splitext(name)
+        n = self.suffixes.get((target_dir, name), 0)
+        while True:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+            if self.keys[target_dir](candidate) not in names:
+                self.suffixes[(target_dir, name)] = n
+                return candidate
+
+    def release(self, destination):
+        # Gives back a name claimed by a move that was re-planned elsewhere.
+        target_dir, name = os.path.split(destination)
+        names = self.names.get(target_dir)
+        if names is None:
+            return
+        key = self.keys[target_dir](name)
+        status = names.get(key)
+        if status == "planned":
+            del names[key]
+        elif status == "replaced":
+            names[key] = "exists"
+
+@functools.lru_cache(maxsize=None)
+def rule_folder(name):
+    # A rule's folder as a normalised relative path, so "Images/2024" gives
+    # the same paths as the scanner's os.scandir entries on Windows too.
+    return os.path.normpath(name)
+
+def resolve_target(folder, entry, rules, music=None, sniffed=None, metrics=None, dated=None):
+    # Returns (target_folder, rule_key, stat) for a scanned file, or None
+    # when no rule applies. Shared by the dry-run planner and the real sort;
+    # only files that match a rule (or need a size/age check) are stat'ed.
+    # `rules` is a config dict or a compiled RuleMatcher; `music` and
+    # `sniffed` may hold is_music results and content-based names already
+    # computed for this batch, `dated` embedded dates read ahead of time.
+    # With a Metrics, each step is timed.
+    name = sniffed.get(entry.path, entry.name) if sniffed else entry.name
+    if metrics is None:
+        matched = compile_rules(rules).match(name, entry.stat)
+    else:
+        started = time.perf_counter()
+        matched = compile_rules(rules).match(name, entry.stat)
+        metrics.add("match", time.perf_counter() - started)
+    if not matched:
+        return None
+    rule_key, rule = matched
+    if metrics is None:
+        st = entry.stat()
+    else:
+        started = time.perf_counter()
+        st = entry.stat()
+        metrics.add("stat", time.perf_counter() - started)
+    target_folder = folder + os.sep + rule_folder(rule["folder"])
+    subfolder_type = rule.get("subfolder")
+    if subfolder_type is None:
+        return target_folder, rule_key, st
+    started = time.perf_counter() if metrics is not None else 0.0
+    if subfolder_type in DATE_SUBFOLDERS:
+        if dated and entry.path in dated:
+            filed = dated[entry.path]
+        elif rule.get("metadata_date"):
+            filed = dates.file_date(entry.path, st, True, entry.inode())
+        else:
+            filed = dates.file_date(entry.path, st)
+        target_folder = target_folder + os.sep + filed.strftime(DATE_SUBFOLDERS[subfolder_type])
+    elif subfolder_type == "musictype":
+        is_track = music[entry.path] if music and entry.path in music else is_music(entry.path, st)
+        target_folder = target_folder + os.sep + ("Music" if is_track else "Other")
+    if metrics is not None:
+        metrics.add(subfolder_type, time.perf_counter() - started)
+    return target_folder, rule_key, st
+
+def _sniff(batch, rules, mode, pool):
+    # Content-based names for the batch: with "missing" only files no rule
+    # matches by name have their header read, with "all" every file does.
+    if mode == "all":
+        candidates = batch
     else:
-        files = [f for f in folder.glob("*") if f.is_file()]
-
-    # --- Sort files according to rules ---
-    for file in files:
-        ext = file.suffix.lower()
-        rule = config.get(ext)
-        if rule:
-            target_folder = folder / rule["folder"]
-            subfolder_type = rule.get("subfolder")
-            if subfolder_type == "year":
-                target_folder = target_folder / get_file_year(file)
-            elif subfolder_type == "musictype":
-                target_folder = target_folder / ("Music" if is_music(file) else "Other")
-            move_file(file, target_folder)
-            # Update summary using relative path
-            rel_path = target_folder.relative_to(folder)
-            summary[str(rel_path)] = summary.get(str(rel_path), 0) + 1
-
-    # --- Save move history ---
-    Path("logs").mkdir(exist_ok=True)
-    with open("logs/move_history.json", "w") as f:
-        json.dump(move_history, f, indent=2)
-
-    print("\nSorting complete.")
+        candidates = []
+        for entry in batch:
+            try:
+                if not rules.match(entry.name, entry.stat):
+                    candidates.append(entry)
+            except OSError:
+                continue
+    if not candidates:
+        return None
+    return sniff.sniff_batch(candidates, mode, pool)
+
+def _classify_music(batch, rules, pool, sniffed=None):
+    # Parses the tags of every "musictype" file in the batch on the pool, so
+    # tag reads overlap each other and the moves still running in the lanes.
+    paths = []
+    for entry in batch:
+        name = sniffed.get(entry.path, entry.name) if sniffed else entry.name
+        try:
+            matched = rules.match(name, entry.stat)
+        except OSError:
+            continue
+        if matched and matched[1].get("subfolder") == "musictype":
+            paths.append(entry.path)
+    if not paths:
+        return None
+    return dict(zip(paths, pool.map(is_music, paths)))
+
+def _read_dates(batch, rules, pool, sniffed=None):
+    # Reads the embedded dates of every "metadata_date" file in the batch on
+    # the pool, the same way _classify_music reads tags.
+    entries = []
+    for entry in batch:
+        name = sniffed.get(entry.path, entry.name) if sniffed else entry.name
+        try:
+            matched = rules.match(name, entry.stat)
+        except OSError:
+            continue
+        if matched and matched[1].get("metadata_date") and matched[1].get("subfolder") in DATE_SUBFOLDERS:
+            entries.append(entry)
+    if not entries:
+        return None
+
+    def read(entry):
+        try:
+            return dates.file_date(entry.path, entry.stat(), True, entry.inode())
+        except OSError:
+            return None
+    return {entry.path: found for entry, found in zip(entries, pool.map(read, entries)) if found}
+
+def _timed_batch(metrics, stage, func, *args):
+    # Runs a per-batch step, recording its time spread over the batch.
+    started = time.perf_counter()
+    result = func(*args)
+    metrics.add(stage, time.perf_counter() - started, max(1, len(args[0])))
+    return result
+
+def _dedupe_plan(batches, folder, mode, names, pool, cancel=None):
+    # Finds identical files among everything planned to move. With
+    # "folder" every copy but the first goes to Duplicates/ instead of its
+    # rule folder; with "hardlink" each copy is first replaced by a hard
+    # link to the kept file (a "link" move) and then sorted as usual.
+    moves = [move for batch in batches for move in batch if move.type == "file"]
+    keeper_of = {}
+    for group in dedupe.find_duplicates(((move.source, move.size) for move in moves), pool, cancel):
+        for duplicate in group[1:]:
+            keeper_of[duplicate] = group[0]
+    if not keeper_of:
+        yield from batches
+        return
+
+    if mode == "hardlink":
+        yield [
+            PlannedMove(move.source, keeper_of[move.source], None, "link", move.size, None)
+            for move in moves if move.source in keeper_of
+        ]
+        yield from batches
+        return
+
+    duplicates_dir = folder + os.sep + dedupe.DUPLICATES_FOLDER
+    for batch in batches:
+        plan = []
+        for move in batch:
+            if move.source in keeper_of:
+                names.release(move.destination)
+                claimed = names.claim(duplicates_dir, os.path.basename(move.source))
+                if claimed is None:
+                    continue
+                move = move._replace(destination=claimed[0], collision=claimed[1])
+            plan.append(move)
+        yield plan
+
+def iter_plan(folder_path, config, behavior, batch_size=1000, index=None, workers=1, sniff_mode=None,
+              dedupe_mode=None, collision_policy="rename", paths=None, metrics=None, on_error=None, cancel=None):
+    # Yields batches of PlannedMove without touching the disk beyond the
+    # directory walk, one listing per target folder and one stat per
+    # matched file. With sniff_mode ("missing" or "all") file headers are
+    # also read to classify files with missing or wrong extensions. With
+    # dedupe_mode ("folder" or "hardlink") the whole plan is built before
+    # the first batch is yielded, so duplicates can be found across it.
+    # Name clashes are settled here, by collision_policy (see
+    # _DestinationIndex), so the moves themselves never probe. Given
+    # `paths`, only those files are planned and the folder is not walked.
+    # Given a Metrics, every planning stage is timed into it. `on_error` is
+    # handed to iter_files for folders that cannot be listed. Once `cancel`
+    # is set no further batch is planned.
+    folder = os.path.abspath(folder_path)
+    rules = compile_rules(config)
+    # Duplicates/ holds an earlier --dedupe run's output; later runs leave
+    # it alone whether or not they dedupe themselves.
+    rule_folders = {rule_folder(rule["folder"]) for rule in config.values()}
+    rule_folders.add(dedupe.DUPLICATES_FOLDER)
+    # A nested rule folder ("Images/2024") keeps its top folder out of the archive
+    top_folders = {name.split(os.sep)[0] for name in rule_folders}
+    archive_path = os.path.join(folder, "Archived_Folders")
+    names = _DestinationIndex(collision_policy)
+
+    # --- Handle pre-existing folders ---
+    if behavior == "Move pre-existing folders to archive" and paths is None:
+        plan = []
+        with os.scandir(folder) as it:
+            for entry in it:
+                if entry.is_dir() and entry.path != archive_path and entry.name not in top_folders:
+                    claimed = names.claim(archive_path, entry.name, "folder")
+                    if claimed:
+                        plan.append(PlannedMove(entry.path, claimed[0], None, "folder", 0, claimed[1]))
+        if plan:
+            yield plan
+
+    # --- Stream files to sort ---
+    # Already-sorted output lives in the rule folders; never walk back into it.
+    recursive = behavior == "Sort contents of pre-existing folders"
+    prune = {os.path.join(folder, name) for name in rule_folders}
+    prune.add(archive_path)
+
+    def plan_files():
+        if paths is None:
+            entries = iter_files(folder, recursive, prune, index, on_error)
+        else:
+            entries = map(_PathEntry, paths)
+        if metrics is not None:
+            entries = metrics.timed_iter(entries, "walk")
+        for batch in iter_batches(entries, batch_size):
+            if cancel is not None and cancel.is_set():
+                return
+            if metrics is None:
+                sniffed = _sniff(batch, rules, sniff_mode, pool) if sniff_mode else None
+                music = _classify_music(batch, rules, pool, sniffed) if workers > 1 else None
+                dated = _read_dates(batch, rules, pool, sniffed) if workers > 1 else None
+            else:
+                sniffed = _timed_batch(metrics, "sniff", _sniff, batch, rules, sniff_mode, pool) if sniff_mode else None
+                music = _timed_batch(metrics, "music_tags", _classify_music, batch, rules, pool, sniffed) \
+                    if workers > 1 else None
+                dated = _timed_batch(metrics, "dates", _read_dates, batch, rules, pool, sniffed) \
+                    if workers > 1 else None
+            plan = []
+            for entry in batch:
+                try:
+                    target = resolve_target(folder, entry, rules, music, sniffed, metrics, dated)
+                    # What sniffing finds can change with a rewrite in place,
+                    # so sniffed files are never remembered as unsortable.
+                    if target is None and index is not None and not sniff_mode \
+                            and not rules.is_conditional(entry.name):
+                        index.remember(entry)
+                except OSError:
+                    continue
+                if target:
+                    target_folder, rule_key, st = target
+                    claimed = names.claim(target_folder, entry.name)
+                    if claimed:
+                        plan.append(PlannedMove(entry.path, claimed[0], rule_key, "file", st.st_size, claimed[1]))
+            yield plan
+
+    pool = None
+    if workers > 1 or sniff_mode or dedupe_mode:
+        pool = ThreadPoolExecutor(max_workers=max(workers, sniff.SNIFF_THREADS if sniff_mode or dedupe_mode else 1))
+    try:
+        if dedupe_mode:
+            batches = list(plan_files())
+            started = time.perf_counter()
+            deduped = list(_dedupe_plan(batches, folder, dedupe_mode, names, pool, cancel))
+            if metrics is not None:
+                metrics.add("dedupe", time.perf_counter() - started, max(1, sum(map(len, batches))))
+            # A cancelled dedupe found nothing, so its plan must not run
+            if cancel is None or not cancel.is_set():
+                yield from deduped
+        else:
+            yield from plan_files()
+    finally:
+        if pool:
+            pool.shutdown()
+        music_cache.save()
+        dates.date_cache.save()
+        if sniff_mode:
+            sniff.sniff_cache.save()
+
+def plan_sort(folder_path, config, behavior, workers=1, sniff_mode=None, dedupe_mode=None,
+              collision_policy="rename"):
+    # Dry run: the full move plan as a compact, saveable dict.
+    moves = []
+    for batch in iter_plan(folder_path, config, behavior, workers=workers, sniff_mode=sniff_mode,
+                           dedupe_mode=dedupe_mode, collision_policy=collision_policy):
+        moves.extend(batch)
+    return {
+        "folder": os.path.abspath(folder_path),
+        "behavior": behavior,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "moves": moves,
+    }
+
+def save_plan(plan, path):
+    # Moves are stored as rows rather than dicts to keep large plans small.
+    with open(path, "w") as f:
+        json.dump({**plan, "columns": list(PlannedMove._fields), "moves": [list(m) for m in plan["moves"]]}, f)
+
+def load_plan(path):
+    with open(path, "r") as f:
+        plan = json.load(f)
+    plan["moves"] = [PlannedMove(*row) for row in plan.pop("moves")]
+    plan.pop("columns", None)
+    return plan
+
+# --- Execution ---
+
+# Batches planned ahead of the moves when the plan's size is not known up
+# front; once planning finishes within this window the total is known.
+PLAN_AHEAD_BATCHES = 100
+_PLAN_END = object()
+
+class _PlanAhead:
+    # Runs a batch generator on its own thread, up to PLAN_AHEAD_BATCHES
+    # ahead of the moves, so `total` is set as soon as planning is done
+    # rather than when the last batch has moved. Iterate it once; close()
+    # stops the planner (and closes the generator on its thread).
+
+    def __init__(self, batches):
+        self.queue = queue.Queue(PLAN_AHEAD_BATCHES)
+        self.total = None
+        self.error = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._plan, args=(batches,), daemon=True)
+        self.thread.start()
+
+    def _plan(self, batches):
+        planned = 0
+        try:
+            for batch in batches:
+                planned += len(batch)
+                if not self._put(batch):
+                    return
+            self.total = planned
+        except Exception as e:
+            self.error = e
+        finally:
+            if hasattr(batches, "close"):
+                batches.close()
+        self._put(_PLAN_END)
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        while True:
+            batch = self.queue.get()
+            if batch is _PLAN_END:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield batch
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+# Events passed to on_event(kind, payload) while a plan runs:
+#   "moved"     payload: the PlannedMove that completed
+#   "linked"    payload: a "link" PlannedMove (duplicate replaced by a link)
+#   "error"     payload: (PlannedMove, error message); a folder the scan
+#               could not list comes as a "scan" PlannedMove of that folder,
+#               with no destination
+#   "progress"  payload: {"planned", "total", "done", "errors", "bytes",
+#               "seconds"}, sent after every batch; "total" is the number
+#               of moves in the plan once it is known (given up front, or
+#               once planning has finished), else None
+#   "complete" / "cancelled"  payload: the summary, sent last
+
+def _run_plan(folder, batches, workers, pool, config=None, behavior=None, on_event=None, cancel=None, total=None,
+              io_limit=None, metrics=None, count_archived=True, plan_ahead=True, scan_errors=None):
+    # `cancel` is a threading.Event (or anything with is_set()). Once it is
+    # set no further move is started; moves already running finish and are
+    # journaled, so a cancelled run is undone like any other.
+    # Archived folders are counted on a background thread while the files
+    # move, or not at all without `count_archived` (their count is None).
+    # Without a total the plan is read ahead on its own thread (see
+    # _PlanAhead) unless `plan_ahead` is False, e.g. under a profiler that
+    # only sees the calling thread. `scan_errors` is a deque of (folder,
+    # error) the planner appends to; they are reported and counted with
+    # the errors of the moves.
+    summary = {}
+    counts = {}
+    counter = None
+    emit = on_event or _ignore_event
+    # Every run gets its own journal; moves are journaled as they complete,
+    # so a crash keeps the undo log.
+    run_id, journal = runs.start_run(folder, config, behavior)
+    executor = MoveExecutor(workers, pool, io_limit, metrics, cancel)
+    moved_files = 0
+    moved_bytes = 0
+    planned = 0
+    errors = 0
+    move_paths = {"rename": 0, "copy": 0, "fallback": 0, "link": 0}
+    started = time.perf_counter()
+    if total is None and plan_ahead:
+        batches = _PlanAhead(batches)
+
+    def harvest(results, stoppable=False):
+        # With `stoppable`, stops pulling from a submit() generator once the
+        # run is cancelled, so the rest of the batch is never started.
+        nonlocal moved_files, moved_bytes, errors, counter
+        for target_dir, moves in results:
+            for move, error, path in moves:
+                if error:
+                    errors += 1
+                    emit("error", (move, error))
+                    continue
+                move_paths[path] += 1
+                if metrics is None:
+                    journal.append(move.source, move.destination, move.type)
+                else:
+                    started_append = time.perf_counter()
+                    journal.append(move.source, move.destination, move.type)
+                    metrics.add("journal", time.perf_counter() - started_append)
+                if move.type == "link":
+                    emit("linked", move)
+                    summary["duplicates_linked"] = summary.get("duplicates_linked", 0) + 1
+                    continue
+                emit("moved", move)
+                if move.collision == "overwrite":
+                    summary["overwritten"] = summary.get("overwritten", 0) + 1
+                # Update summary using relative path
+                if move.type == "folder":
+                    rel_path = os.path.relpath(move.destination, folder)
+                    summary[rel_path] = None
+                    if count_archived:
+                        if counter is None:
+                            counter = ThreadPoolExecutor(max_workers=1)
+                        counts[rel_path] = counter.submit(count_entries, move.destination)
+                    continue
+                rel_path = os.path.relpath(target_dir, folder)
+                summary[rel_path] = summary.get(rel_path, 0) + 1
+                moved_files += 1
+                moved_bytes += move.size
+            if stoppable and cancel is not None and cancel.is_set():
+                return
+
+    def report_scan_errors():
+        nonlocal errors
+        while scan_errors:
+            path, error = scan_errors.popleft()
+            errors += 1
+            emit("error", (PlannedMove(path, None, None, "scan", 0, None), error))
+
+    def report(total):
+        emit("progress", {
+            "planned": planned,
+            "total": total,
+            "done": sum(move_paths.values()),
+            "errors": errors,
+            "bytes": moved_bytes,
+            "seconds": time.perf_counter() - started,
+        })
+
+    cancelled = False
+    try:
+        for batch in batches:
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            planned += len(batch)
+            harvest(executor.submit(batch), stoppable=True)
+            # Folder and link batches must land before later files move
+            if batch and batch[0].type != "file":
+                harvest(executor.drain())
+            if scan_errors:
+                report_scan_errors()
+            report(total if total is not None else getattr(batches, "total", None))
+        if cancel is not None and cancel.is_set():
+            executor.stop()
+        harvest(executor.finish())
+        cancelled = cancelled or (cancel is not None and cancel.is_set())
+    finally:
+        if hasattr(batches, "close"):
+            batches.close()
+        journal.close()
+        if counter is not None:
+            counter.shutdown()
+    if scan_errors:
+        report_scan_errors()
+    report(planned)
+    for rel_path, count in counts.items():
+        summary[rel_path] = count.result()
+
+    elapsed = time.perf_counter() - started
+    summary["throughput"] = {
+        "files": moved_files,
+        "bytes": moved_bytes,
+        "seconds": round(elapsed, 3),
+        "files_per_s": round(moved_files / elapsed, 1) if elapsed else 0.0,
+        "bytes_per_s": round(moved_bytes / elapsed, 1) if elapsed else 0.0,
+    }
+    summary["move_paths"] = move_paths
+    summary["errors"] = errors
+    if metrics is not None:
+        summary["metrics"] = metrics.as_dict()
+    status = "cancelled" if cancelled else "complete"
+    runs.finish_run(run_id, {"moves": journal.count, "throughput": summary["throughput"], "move_paths": move_paths},
+                    status)
+    summary["run_id"] = run_id
+    summary["status"] = status
+
+    emit(status, summary)
     return summary
 
+def _ignore_event(kind, payload):
+    pass
+
+def sort_paths(folder_path, paths, config, behavior, workers=1, pool="thread", sniff_mode=None, dedupe_mode=None,
+               collision_policy="rename", on_event=None, cancel=None, metrics=None):
+    # Sorts just the given files of folder_path as one run. Nothing is
+    # recorded when none of them matches a rule.
+    folder = os.path.abspath(folder_path)
+    batches = [batch for batch in iter_plan(folder, config, behavior, len(paths) or 1, workers=workers,
+                                            sniff_mode=sniff_mode, dedupe_mode=dedupe_mode,
+                                            collision_policy=collision_policy, paths=paths, metrics=metrics,
+                                            cancel=cancel)
+               if batch]
+    if not batches:
+        return None
+    return _run_plan(folder, batches, workers, pool, config, behavior, on_event, cancel,
+                     sum(len(batch) for batch in batches), metrics=metrics)
+
+def execute_plan(plan, workers=1, pool="thread", batch_size=1000, on_event=None, cancel=None, metrics=None,
+                 count_archived=True):
+    # Runs a plan from plan_sort/load_plan without rescanning the folder.
+    batches = iter_typed_batches(plan["moves"], batch_size)
+    return _run_plan(plan["folder"], batches, workers, pool, behavior=plan.get("behavior"), on_event=on_event,
+                     cancel=cancel, total=len(plan["moves"]), metrics=metrics, count_archived=count_archived)
+
+def scan_and_sort(folder_path, config, behavior, workers=1, pool="thread", batch_size=1000, incremental=False,
+                  sniff_mode=None, dedupe_mode=None, collision_policy="rename", on_event=None, cancel=None,
+                  io_limit=None, metrics=None, count_archived=True, plan_ahead=True):
+    # Absolute paths keep the journal undoable from any working directory.
+    # Pass a metrics.Metrics to get per-stage timings in summary["metrics"].
+    # With count_archived=False folders moved to the archive are not counted;
+    # with plan_ahead=False planning stays on the calling thread.
+    folder = os.path.abspath(folder_path)
+    # Folders that cannot be listed are reported as errors of the run
+    scan_errors = deque()
+    index = None
+    if incremental:
+        # Only new or changed entries are planned; the index is committed once
+        # the run has finished so an interrupted sort is simply redone.
+        from scan_index import ScanIndex
+        index = ScanIndex(folder, config, behavior, {"sniff": sniff_mode, "dedupe": dedupe_mode})
+    batches = iter_plan(folder, config, behavior, batch_size, index, workers, sniff_mode, dedupe_mode,
+                        collision_policy, metrics=metrics,
+                        on_error=lambda path, error: scan_errors.append((path, str(error))), cancel=cancel)
+    summary = _run_plan(folder, batches, workers, pool, config, behavior, on_event, cancel, io_limit=io_limit,
+                        metrics=metrics, count_archived=count_archived, plan_ahead=plan_ahead,
+                        scan_errors=scan_errors)
+    if index is not None:
+        index.close()
+    return summary
@@ -0,0 +1,99 @@
+import sys
+import json
+import time
+from importlib.abc import MetaPathFinder
+
+# Startup measurement for the GUI (new_gui.py --startup-timing): times the
+# import of every module loaded after install() and, once the first window
+# is up, writes a report next to the logs.
+
+class _TimingLoader:
+    # Wraps a module's real loader and times its exec_module; time spent
+    # importing nested modules is subtracted to give the module's own cost.
+
+    def __init__(self, loader, timer):
+        self.loader = loader
+        self.timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.timer.stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - started
+            nested = self.timer.stack.pop()
+            if self.timer.stack:
+                self.timer.stack[-1] += total
+            self.timer.modules[module.__name__] = (total, total - nested)
+
+class ImportTimer(MetaPathFinder):
+
+    def __init__(self):
+        self.modules = {}
+        self.stack = []
+        self.finding = set()
+
+    def find_spec(self, name, path=None, target=None):
+        if name in self.finding:
+            return None
+        # Ask the finders after this one, then time the loader they return
+        self.finding.add(name)
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(name, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self.finding.discard(name)
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimingLoader(spec.loader, self)
+        return spec
+
+_timer = None
+_started = None
+
+def install(started=None):
+    # `started` is the perf_counter reading taken first thing at startup.
+    global _timer, _started
+    _started = started if started is not None else time.perf_counter()
+    _timer = ImportTimer()
+    sys.meta_path.insert(0, _timer)
+
+def report(top=25):
+    # Call once the first window has been shown. Returns the report dict.
+    from journal import LOG_DIR
+    first_window = time.perf_counter() - _started
+    modules = sorted(_timer.modules.items(), key=lambda item: item[1][1], reverse=True)
+    result = {
+        "first_window_seconds": round(first_window, 4),
+        "import_seconds": round(sum(own for _, (_, own) in modules), 4),
+        "modules": [
+            {"module": name, "self_ms": round(own * 1000, 2), "cumulative_ms": round(total * 1000, 2)}
+            for name, (total, own) in modules
+        ],
+    }
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    path = LOG_DIR / "startup_timing.json"
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+
+    # Frozen windowed builds have no console; the JSON file is the report there.
+    if sys.stdout is not None:
+        print(f"Time to first window: {first_window * 1000:.1f} ms")
+        print(f"Module imports:       {result['import_seconds'] * 1000:.1f} ms")
+        print(f"{'self ms':>9} {'cumul. ms':>10}  module")
+        for entry in result["modules"][:top]:
+            print(f"{entry['self_ms']:>9.2f} {entry['cumulative_ms']:>10.2f}  {entry['module']}")
+        print(f"Full report written to {path}")
+    return result
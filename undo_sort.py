@@ -1,43 +1,179 @@
+import os
 import json
-import shutil
+import argparse
 from pathlib import Path
+from datetime import datetime
+from journal import LEGACY_HISTORY_PATH, iter_journal_reverse
+from sorter import MoveExecutor, PlannedMove, iter_typed_batches
+import runs
+import dedupe
 
-def undo_moves():
-    history_path = Path("logs/move_history.json")
-    if not history_path.exists():
-        print("No move history found.")
-        return
+def _iter_records(history_path):
+    # Newest record first. The journal is streamed backwards; a history left
+    # by older versions is a single JSON list and is loaded whole.
+    if history_path.suffix == ".jsonl":
+        yield from iter_journal_reverse(history_path)
+    else:
+        with open(history_path, "r") as f:
+            yield from reversed(json.load(f))
 
-    with open(history_path, "r") as f:
-        moves = json.load(f)
+def _history_id(history_path):
+    st = history_path.stat()
+    return [str(history_path), st.st_size, st.st_mtime_ns]
 
-    # Sort by path depth descending to safely undo nested files/folders
-    moves_sorted = sorted(moves, key=lambda x: len(Path(x["destination"]).parts), reverse=True)
+def _load_checkpoint(history_path, checkpoint_path):
+    # Number of newest records already restored by an interrupted undo of
+    # this same history, or 0.
+    try:
+        with open(checkpoint_path, "r") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if checkpoint.get("history") != _history_id(history_path):
+        return 0
+    return checkpoint.get("done", 0)
 
-    for move in reversed(moves_sorted):
-        src = Path(move["destination"])
-        dst = Path(move["source"])
-        dst.parent.mkdir(parents=True, exist_ok=True)
+def _save_checkpoint(history_path, checkpoint_path, done):
+    tmp_path = checkpoint_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"history": _history_id(history_path), "done": done}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def _remove_empty_folders(folders, root):
+    # Every folder the sort moved into, plus its ancestors up to (not
+    # including) the sorted folder, deepest first. rmdir refuses non-empty
+    # folders, so no listing is needed to tell which ones to keep.
+    candidates = set()
+    for folder in folders:
+        while folder not in candidates and folder != root and root in folder.parents:
+            candidates.add(folder)
+            folder = folder.parent
+    for folder in sorted(candidates, key=lambda x: len(x.parts), reverse=True):
         try:
-            if src.exists():
-                shutil.move(str(src), str(dst))
-                print(f"Restored {move['type'].capitalize()} {src} -> {dst}")
-        except Exception as e:
-            print(f"Error restoring {src}: {e}")
+            folder.rmdir()
+            print(f"Deleted empty folder: {folder}")
+        except OSError:
+            pass
+
+def _undo_history(history_path, checkpoint_path, workers, batch_size):
+    resume_after = _load_checkpoint(history_path, checkpoint_path)
+    if resume_after:
+        print(f"Resuming undo after {resume_after} restored move(s).")
+
+    root = None
+    common = None
+    folders = set()
+
+    def restores():
+        nonlocal root, common
+        skipped = 0
+        for record in _iter_records(history_path):
+            if record.get("type") == "run":
+                root = Path(record["folder"])
+                continue
+            if record["type"] != "link":
+                folders.add(Path(record["destination"]).parent)
+            source_dir = os.path.dirname(record["source"])
+            common = source_dir if common is None else os.path.commonpath([common, source_dir])
+            if skipped < resume_after:
+                skipped += 1
+                continue
+            yield PlannedMove(record["destination"], record["source"], None, record["type"], 0, None)
+
+    done = resume_after
+    executor = MoveExecutor(workers)
+    for batch in iter_typed_batches(restores(), batch_size):
+        if batch[0].type == "link":
+            # Duplicates replaced by hard links get their own copy back
+            _report(_unlink_duplicates(batch))
+        else:
+            for target_dir, results in executor.submit(batch):
+                _report(results)
+            for target_dir, results in executor.drain():
+                _report(results)
+        done += len(batch)
+        _save_checkpoint(history_path, checkpoint_path, done)
+    for target_dir, results in executor.finish():
+        _report(results)
 
     # Clean up empty folders created during sort
-    all_folders = {Path(m['destination']).parent for m in moves_sorted}
-    for folder in sorted(all_folders, key=lambda x: len(x.parts), reverse=True):
-        try:
-            while folder.exists() and folder != folder.parent and not any(folder.iterdir()):
-                folder.rmdir()
-                print(f"Deleted empty folder: {folder}")
-                folder = folder.parent
-        except Exception as e:
-            print(f"Error cleaning folder {folder}: {e}")
+    if root is None and common is not None:
+        root = Path(common)
+    if root is not None:
+        _remove_empty_folders(folders, root)
 
     history_path.unlink()
+    checkpoint_path.unlink(missing_ok=True)
+
+def _unlink_duplicates(moves):
+    results = []
+    for move in moves:
+        try:
+            dedupe.unlink_duplicate(move.destination)
+        except OSError as e:
+            results.append((move, str(e), None))
+            continue
+        results.append((move, None, "copy"))
+    return results
+
+def _report(results):
+    for move, error, path in results:
+        if error is None:
+            print(f"Restored {move.type.capitalize()} {move.source} -> {move.destination}")
+        elif os.path.exists(move.source):
+            print(f"Error restoring {move.source}: {error}")
+
+def undo_run(run_id, workers=4, batch_size=1000):
+    history_path = runs.journal_path(run_id)
+    if not history_path.exists():
+        print(f"No move history found for run {run_id}.")
+        return False
+    print(f"Undoing run {run_id}...")
+    _undo_history(history_path, history_path.with_suffix(".undo.json"), workers, batch_size)
+    runs.mark_undone(run_id)
+    return True
+
+def undo_moves(workers=4, batch_size=1000):
+    # Undoes the most recent run that has not been undone yet.
+    pending = runs.undoable_runs()
+    if pending:
+        undo_run(pending[0]["id"], workers, batch_size)
+    elif LEGACY_HISTORY_PATH.exists():
+        _undo_history(LEGACY_HISTORY_PATH, LEGACY_HISTORY_PATH.with_suffix(".undo.json"), workers, batch_size)
+    else:
+        print("No move history found.")
+        return
+    print("\nUndo complete.")
+
+def undo_until(timestamp, workers=4, batch_size=1000):
+    # Rolls back every run started at or after `timestamp`, newest first.
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    for run in runs.undoable_runs():
+        if datetime.fromisoformat(run["started"]) < timestamp:
+            break
+        undo_run(run["id"], workers, batch_size)
     print("\nUndo complete.")
 
+def print_runs():
+    for run in runs.list_runs():
+        moves = run.get("stats", {}).get("moves", "?")
+        print(f"{run['id']}  {run['started']}  {run['status']:<8}  {moves:>8} moves  {run['folder']}")
+
 if __name__ == "__main__":
-    undo_moves()
+    parser = argparse.ArgumentParser(description="Undo Sortly runs")
+    parser.add_argument("--list", action="store_true", help="List recorded runs")
+    parser.add_argument("--run", metavar="ID", help="Undo the run with this id")
+    parser.add_argument("--until", metavar="TIME", help="Undo every run started at or after TIME (ISO format)")
+    parser.add_argument("--workers", type=int, default=4, help="Number of parallel restore lanes")
+    args = parser.parse_args()
+
+    if args.list:
+        print_runs()
+    elif args.run:
+        if undo_run(args.run, args.workers):
+            print("\nUndo complete.")
+    elif args.until:
+        undo_until(args.until, args.workers)
+    else:
+        undo_moves(args.workers)
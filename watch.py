@@ -0,0 +1,260 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from sorter import scan_and_sort, sort_paths, iter_files, rule_folder
+from dedupe import DUPLICATES_FOLDER
+
+# inotify event bits (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT = struct.Struct("iIII")
+
+# Paths waiting to settle are capped; past this the queue is dropped and
+# the whole folder is rescanned instead, so memory stays bounded no matter
+# how many files arrive at once.
+MAX_PENDING = 10000
+# Marker a source returns when it lost track of events and a full scan is due.
+RESCAN = object()
+# A steady stream of events never goes quiet; settled files are still
+# sorted at least this often (seconds).
+MAX_DELAY = 30.0
+
+class InotifySource:
+    """Reports files created in or moved into the watched folders (Linux).
+
+    Only the sorted folder is watched, plus its subfolders when the
+    behaviour sorts them too; rule folders and the archive are pruned, so
+    Sortly's own moves raise no events.
+    """
+
+    def __init__(self, folder, recursive, prune):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.recursive = recursive
+        self.prune = prune
+        self.watches = {}
+        self.found = []
+        self._add_tree(folder)
+
+    def _add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify watch limit reached; raise fs.inotify.max_user_watches or use --poll")
+            return
+        self.watches[wd] = path
+
+    def _add_tree(self, folder, report=False):
+        # Watches folder, and its subfolders when recursive. With `report`
+        # the files already inside (written before the watch was in place)
+        # are reported too.
+        pending = [folder]
+        while pending:
+            current = pending.pop()
+            self._add_watch(current)
+            if not self.recursive and not report:
+                return
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive and entry.path not in self.prune:
+                                pending.append(entry.path)
+                        elif report:
+                            self.found.append(entry.path)
+            except OSError:
+                continue
+
+    def wait(self, timeout):
+        # Returns the paths seen within `timeout` seconds (None waits until
+        # something happens), or RESCAN.
+        paths, self.found = self.found, []
+        if paths:
+            return paths
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return RESCAN
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO) and path not in self.prune:
+                    self._add_tree(path, report=True)
+                continue
+            paths.append(path)
+        paths.extend(self.found)
+        self.found = []
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+class PollSource:
+    """Fallback for platforms without inotify: rescans the folder every
+    `interval` seconds and reports files that are new or changed.
+
+    Only the size and mtime of files still waiting to be sorted are kept;
+    sorted files leave the scanned area, so the snapshot does not grow with
+    the number of files handled.
+    """
+
+    def __init__(self, folder, recursive, prune, interval=5.0):
+        self.folder = folder
+        self.recursive = recursive
+        self.prune = prune
+        self.interval = interval
+        self.next_poll = 0.0
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for entry in iter_files(self.folder, self.recursive, self.prune):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            snapshot[entry.path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout):
+        delay = self.next_poll - time.monotonic()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(delay, 0))
+        self.next_poll = time.monotonic() + self.interval
+        snapshot = self._scan()
+        changed = [path for path, sig in snapshot.items() if self.snapshot.get(path) != sig]
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+class _Settler:
+    # Holds candidate paths until they stop changing: a file is ready once
+    # its size and mtime have stayed the same for `settle` seconds, so
+    # downloads and copies still being written are left alone.
+
+    def __init__(self, settle):
+        self.settle = settle
+        self.pending = {}
+        self.overflowed = False
+
+    def add(self, paths):
+        for path in paths:
+            if path not in self.pending:
+                if len(self.pending) >= MAX_PENDING:
+                    self.pending.clear()
+                    self.overflowed = True
+                    return
+                self.pending[path] = (None, 0.0)
+
+    def ready(self, now):
+        ready = []
+        for path, (sig, since) in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != sig:
+                self.pending[path] = (current, now)
+            elif now - since >= self.settle:
+                del self.pending[path]
+                ready.append(path)
+        return ready
+
+def watch(folder_path, config, behavior, workers=1, poll=False, poll_interval=5.0, debounce=1.0, settle=2.0,
+          batch_size=1000, incremental=False, sniff_mode=None, dedupe_mode=None, collision_policy="rename",
+          on_event=None):
+    # Sorts the folder once, then keeps sorting files as they arrive until
+    # interrupted. Events are gathered until `debounce` seconds pass without
+    # a new one; each settled batch is sorted as its own run, so every batch
+    # can be undone on its own.
+    folder = os.path.abspath(folder_path)
+    options = {"sniff_mode": sniff_mode, "dedupe_mode": dedupe_mode, "collision_policy": collision_policy,
+               "on_event": on_event}
+    recursive = behavior == "Sort contents of pre-existing folders"
+    rule_folders = {rule_folder(rule["folder"]) for rule in config.values()}
+    rule_folders.update({"Archived_Folders", DUPLICATES_FOLDER})
+    prune = {os.path.join(folder, name) for name in rule_folders}
+
+    # The event source is set up before the first sort, so files arriving
+    # while it runs are reported rather than missed.
+    source = None
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            source = InotifySource(folder, recursive, prune)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}); polling every {poll_interval}s instead.")
+    if source is None:
+        source = PollSource(folder, recursive, prune, poll_interval)
+
+    settler = _Settler(settle)
+    tick = min(debounce, settle) / 2
+    try:
+        scan_and_sort(folder, config, behavior, workers, batch_size=batch_size, incremental=incremental, **options)
+        print(f"Watching {folder} for new files. Press Ctrl+C to stop.")
+        last_event = last_check = time.monotonic()
+        while True:
+            idle = not settler.pending and not settler.overflowed
+            paths = source.wait(None if idle else tick)
+            now = time.monotonic()
+            if paths is RESCAN:
+                settler.pending.clear()
+                settler.overflowed = True
+            elif paths:
+                settler.add(paths)
+                last_event = now
+            if now - last_event < debounce and now - last_check < MAX_DELAY:
+                continue
+            last_check = now
+
+            if settler.overflowed:
+                # Too many events to track one by one: sort the folder as a whole.
+                settler.overflowed = False
+                print("Event queue overflowed; rescanning the folder.")
+                scan_and_sort(folder, config, behavior, workers, batch_size=batch_size, incremental=incremental,
+                              **options)
+                continue
+            ready = settler.ready(now)
+            for start in range(0, len(ready), batch_size):
+                sort_paths(folder, ready[start:start + batch_size], config, behavior, workers, **options)
+    finally:
+        source.close()